@@ -1,19 +1,1846 @@
-import tkinter as tk
-from tkinter import messagebox, filedialog, ttk
+import time
+_IMPORT_START = time.perf_counter()  # Отсчёт времени запуска (VideoCameraApp.startup)
 import cv2
 import numpy as np
-from PIL import Image, ImageTk
+from PIL import Image, ImageDraw
 from datetime import datetime
 import os
 import sys
 import threading
-import sounddevice as sd
 import wave
 import struct
+import ast
+import queue
+import heapq
+import shutil
+import socket
+import subprocess
+import argparse
+import json
+import csv
+from contextlib import nullcontext
+from collections import deque
+import math
+import hashlib
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+# tkinter и PIL.ImageTk нужны только окну - импортируются в _load_tk(), чтобы пакетная
+# обработка работала на серверах без Tk (например, Debian/Ubuntu без python3-tk)
+tk = messagebox = filedialog = ttk = ImageTk = None
+
+
+def _load_tk():
+    global tk, messagebox, filedialog, ttk, ImageTk
+    import tkinter
+    from tkinter import messagebox, filedialog, ttk
+    from PIL import ImageTk
+    tk = tkinter
+
+
+# sounddevice (PortAudio) импортируется при первой записи звука - окну и пакетной
+# обработке он не нужен, а импорт заметно удлиняет запуск
+sd = None
+
+
+def _load_sounddevice():
+    global sd
+    if sd is None:
+        try:
+            import sounddevice
+        except (ImportError, OSError) as e:
+            raise RuntimeError("Для записи звука установите: pip install sounddevice") from e
+        sd = sounddevice
+    return sd
+
+
+# Функции и константы, доступные в формулах эффектов
+MATH_FUNCS = {
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+    'arcsin': np.arcsin, 'arccos': np.arccos, 'arctan': np.arctan,
+    'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh,
+    'pi': np.pi, 'e': np.exp(1), 'exp': np.exp, 'log': np.log, 'sqrt': np.sqrt
+}
+
+# Переменные формул: x, y - координаты (x от -10 до 10 по ширине, y в том же масштабе),
+# r, theta - полярные координаты относительно центра кадра, t - время в секундах
+FORMULA_VARIABLES = ('x', 'y', 'r', 'theta', 't')
+
+# Узлы AST, допустимые в формуле (всё остальное - атрибуты, индексы, лямбды и т.п. - запрещено)
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant, ast.Tuple,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UAdd, ast.USub,
+)
+
+
+class FormulaError(ValueError):
+    """Ошибка разбора или проверки формулы эффекта"""
+
+
+class _ConstantFolder(ast.NodeTransformer):
+    """Сворачивает подвыражения без переменных (2*pi, sqrt(2), ...) в числа"""
+
+    def __init__(self, funcs):
+        self.funcs = funcs
+
+    def visit_Constant(self, node):
+        try:
+            value = float(node.value)
+        except OverflowError:
+            raise FormulaError("Недопустимая константа: слишком большое число")
+        return ast.copy_location(ast.Constant(value), node)
+
+    def visit_Name(self, node):
+        value = self.funcs.get(node.id)
+        if isinstance(value, float):
+            # float(): e - это np.float64, который compile() не принимает в ast.Constant
+            return ast.copy_location(ast.Constant(float(value)), node)
+        return node
+
+    def _fold(self, node):
+        self.generic_visit(node)
+        operands = ([node.operand] if isinstance(node, ast.UnaryOp) else
+                    [node.left, node.right] if isinstance(node, ast.BinOp) else node.args)
+        if not all(isinstance(op, ast.Constant) for op in operands):
+            return node
+        try:
+            with np.errstate(all='ignore'):
+                value = eval(compile(ast.Expression(node), '<formula>', 'eval'),
+                             {'__builtins__': {}, **self.funcs})
+            value = float(value)
+        except (ArithmeticError, ValueError, TypeError):
+            return node  # Оставляем как есть - ошибка проявится при вычислении
+        return ast.copy_location(ast.Constant(value), node)
+
+    visit_UnaryOp = visit_BinOp = visit_Call = _fold
+
+
+def _depends_on_time(node):
+    return any(isinstance(n, ast.Name) and n.id == 't' for n in ast.walk(node))
+
+
+class _TimeInvariantHoister(ast.NodeTransformer):
+    """Выносит подвыражения без t (sin(x), sqrt(r)*2, ...) в отдельные имена _c0, _c1, ...
+
+    Для анимированной формулы они считаются один раз на размер кадра,
+    а на каждом кадре остаётся только часть, зависящая от t.
+    """
+
+    def __init__(self):
+        self.hoisted = []  # [(имя, узел)]
+
+    def visit(self, node):
+        if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Call)) and not _depends_on_time(node):
+            name = f"_c{len(self.hoisted)}"
+            self.hoisted.append((name, node))
+            return ast.copy_location(ast.Name(name, ast.Load()), node)
+        return super().visit(node)
+
+
+class CompiledFormula:
+    """Формула, один раз скомпилированная в объект кода.
+
+    Вызывается как векторная функция: formula(x=массив) или
+    formula(out=буфер, x=массив) для записи результата в готовый буфер.
+    Формула вида "dx, dy" (is_vector) возвращает пару смещений.
+    У формулы с t (is_animated) подвыражения без t вынесены в hoisted:
+    их значения считает invariants(), а __call__ принимает их вместе с t.
+    """
+
+    def __init__(self, source, tree, variables, funcs, hoisted=()):
+        self.source = source
+        self.tree = tree
+        self.variables = variables
+        self.is_vector = isinstance(tree.body, ast.Tuple)
+        self.is_animated = 't' in variables
+        # Сдвиг столбцов y = f(x): таблицы строятся из одномерного вектора
+        self.is_separable = not self.is_vector and variables <= {'x', 't'}
+        self._code = compile(tree, '<formula>', 'eval')
+        self._globals = {'__builtins__': {}, **funcs}
+        self._hoisted = [(name, compile(ast.Expression(node), '<formula>', 'eval'))
+                         for name, node in hoisted]
+
+    def invariants(self, **values):
+        """Значения подвыражений без t для данных координат (без t формула не вызывается)"""
+        with np.errstate(all='ignore'):
+            return {name: eval(code, self._globals, values) for name, code in self._hoisted}
+
+    def __call__(self, out=None, **values):
+        with np.errstate(all='ignore'):
+            result = eval(self._code, self._globals, values)
+        if out is None:
+            return result
+        np.copyto(out, result, casting='unsafe')
+        return out
+
+
+def compile_formula(formula, funcs=MATH_FUNCS, variables=FORMULA_VARIABLES):
+    """Проверяет формулу по белому списку узлов AST и компилирует её.
+
+    Допустимы одно выражение (вертикальный сдвиг) или пара "dx, dy".
+
+    Выбрасывает FormulaError с понятным пользователю сообщением.
+    """
+    try:
+        tree = ast.parse(formula, mode='eval')
+    except SyntaxError:
+        raise FormulaError("Неправильный синтаксис формулы")
+
+    unknown = []
+    # Имена функций допустимы только на месте вызываемого: "sin" без скобок - ошибка
+    callees = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise FormulaError(f"Недопустимая конструкция в формуле: {type(node).__name__}")
+        if isinstance(node, ast.Tuple) and (node is not tree.body or len(node.elts) != 2):
+            raise FormulaError("Ожидается одно выражение или пара смещений 'dx, dy'")
+        if isinstance(node, ast.Constant) and (
+                isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+            raise FormulaError(f"Недопустимая константа: {node.value!r}")
+        if isinstance(node, ast.Name) and node.id not in variables and node.id not in funcs:
+            unknown.append(node.id)
+        if isinstance(node, ast.Name) and callable(funcs.get(node.id)) and id(node) not in callees:
+            raise FormulaError(f"Функция '{node.id}' используется без аргумента: {node.id}(...)")
+        if isinstance(node, ast.Call):
+            if node.keywords or not isinstance(node.func, ast.Name) or not callable(funcs.get(node.func.id)):
+                name = node.func.id if isinstance(node.func, ast.Name) else ast.unparse(node.func)
+                raise FormulaError(f"'{name}' не является функцией")
+            # Все функции формул одноаргументные; второй аргумент numpy принял бы
+            # за буфер out и писал бы в массивы движка
+            if len(node.args) != 1:
+                raise FormulaError(f"Функция '{node.func.id}' принимает ровно один аргумент")
+
+    if unknown:
+        available = ", ".join(sorted(funcs.keys()))
+        names = ", ".join(f"'{v}'" for v in variables)
+        raise FormulaError(f"Используйте только {names} как переменные или проверьте правильность "
+                           f"написания функции из доступных. Найдены: {', '.join(unknown)}\n"
+                           f"Доступные: {available}")
+
+    tree = ast.fix_missing_locations(_ConstantFolder(funcs).visit(tree))
+    used = frozenset(node.id for node in ast.walk(tree)
+                     if isinstance(node, ast.Name) and node.id in variables)
+    hoisted = []
+    if 't' in used:
+        hoister = _TimeInvariantHoister()
+        tree = ast.fix_missing_locations(hoister.visit(tree))
+        hoisted = hoister.hoisted
+    return CompiledFormula(formula, tree, used, funcs, hoisted)
+
+
+def compile_chain(text, funcs=MATH_FUNCS):
+    """Компилирует цепочку эффектов "f1; f2; ..." (применяются слева направо)"""
+    sources = [part.strip() for part in text.split(";") if part.strip()]
+    chain = []
+    for i, source in enumerate(sources, 1):
+        try:
+            chain.append(compile_formula(source, funcs))
+        except FormulaError as e:
+            if len(sources) == 1:
+                raise
+            raise FormulaError(f"Эффект {i} ({source}): {e}")
+    return chain
+
+
+class RemapCache:
+    """Кэш таблиц пересчёта координат для cv2.remap.
+
+    Таблицы строятся заново только при смене ключа (формула, размер кадра,
+    интерполяция). При fixed_point=True таблицы хранятся в компактном
+    формате CV_16SC2, который cv2.remap обрабатывает быстрее всего.
+    """
+
+    def __init__(self, fixed_point=True, disk=None):
+        self.fixed_point = fixed_point
+        self.disk = disk  # MapDiskCache или None
+        # (ключ, таблицы) хранятся одним кортежем, чтобы потоки обработки
+        # никогда не увидели новый ключ со старыми таблицами
+        self._entry = None
+
+    def get(self, key, build):
+        """Возвращает (map1, map2) для ключа, вызывая build() при промахе"""
+        entry = self._entry
+        if entry is None or entry[0] != key:
+            disk, disk_key = self.disk, (key, self.fixed_point)
+            maps = disk.load(disk_key) if disk is not None else None
+            if maps is None:
+                map_x, map_y = build()
+                if self.fixed_point:
+                    map_x, map_y = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+                maps = (map_x, map_y)
+                if disk is not None:
+                    disk.store(disk_key, maps)
+            entry = (key, maps)
+            self._entry = entry
+        return entry[1]
+
+    def clear(self):
+        self._entry = None
+
+
+def default_cache_dir():
+    """Каталог кэша программы: %LOCALAPPDATA%\\ReDisCa или ~/.cache/redisca"""
+    if os.environ.get("LOCALAPPDATA"):
+        return os.path.join(os.environ["LOCALAPPDATA"], "ReDisCa")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "redisca")
+
+
+class MapDiskCache:
+    """Готовые таблицы remap на диске, общие для запусков программы.
+
+    Ключ (нормализованный AST формул, размеры, интерполяция, формат таблиц)
+    хэшируется в имя файла; map1 и map2 лежат в отдельных .npy и читаются
+    через mmap, т.е. без пересчёта и без копирования в память. Время
+    изменения файла - отметка последнего использования: при превышении
+    max_bytes удаляются давно не использованные таблицы (LRU).
+    Ошибки диска не мешают работе - таблица просто строится заново.
+    """
+
+    # Увеличить при изменении построения таблиц, чтобы старые файлы не подхватывались
+    version = 1
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        digest = hashlib.sha1(repr((self.version, cv2.__version__, key)).encode()).hexdigest()
+        return [os.path.join(self.directory, f"{digest}_{i}.npy") for i in (1, 2)]
+
+    def load(self, key):
+        path1, path2 = self._paths(key)
+        try:
+            map1 = np.load(path1, mmap_mode="r")
+            map2 = np.load(path2, mmap_mode="r") if os.path.exists(path2) else None
+            os.utime(path1)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return map1, map2
+
+    def store(self, key, maps):
+        paths = self._paths(key)
+        try:
+            # map2 пишется первым: появление map1 означает, что запись завершена
+            for path, data in reversed(list(zip(paths, maps))):
+                if data is None:
+                    continue
+                tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+                np.save(tmp, np.ascontiguousarray(data))
+                os.replace(tmp + ".npy", path)
+            self.evict()
+        except OSError as e:
+            print(f"Ошибка записи кэша таблиц: {e}")
+
+    def evict(self):
+        """Удаляет давно не использованные таблицы, пока кэш больше max_bytes"""
+        entries = {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".npy"):
+                continue
+            digest = entry.name.split("_")[0]
+            stat = entry.stat()
+            size, mtime = entries.get(digest, (0, 0))
+            # Время использования - у map1 (его обновляет load)
+            entries[digest] = (size + stat.st_size,
+                               stat.st_mtime if entry.name.endswith("_1.npy") else mtime)
+        total = sum(size for size, _ in entries.values())
+        for digest, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            try:
+                # map1 удаляется первым, чтобы load не нашёл половину записи
+                for i in (1, 2):
+                    path = os.path.join(self.directory, f"{digest}_{i}.npy")
+                    if os.path.exists(path):
+                        os.remove(path)
+                total -= size
+            except OSError:
+                pass  # Файл открыт (mmap в Windows) - удалим в следующий раз
+
+
+def column_shift(formula, width, height):
+    """Вертикальный сдвиг каждого столбца (в пикселях) для формулы y = f(x)"""
+    x = np.linspace(-10, 10, width)
+
+    # Формула уже скомпилирована - здесь только вычисление
+    shift = formula(out=np.empty(width), x=x)
+    return _normalize_shift(shift, height)
+
+
+def _normalize_shift(shift, height):
+    """Растягивает значения формулы на высоту кадра и центрирует (как в исходной версии)"""
+    shift = np.nan_to_num(shift, copy=False)  # Заменяем NaN на 0
+
+    y_min, y_max = np.min(shift), np.max(shift)
+    if y_max - y_min > 0:
+        shift = (shift - y_min) / (y_max - y_min) * height
+    else:
+        shift = np.zeros_like(shift)
+    return shift - height//2
+
+
+def build_column_shift_maps(formula, width, height):
+    """Таблицы remap для формулы y = f(x): каждый столбец сдвигается по вертикали.
+
+    Формула вычисляется на одном векторе длины width, таблицы собираются
+    сложением с broadcast - без meshgrid и двумерного вычисления формулы.
+    """
+    shift = column_shift(formula, width, height).astype(np.float32)
+    map_x = np.empty((height, width), np.float32)
+    map_x[:] = np.arange(width, dtype=np.float32)
+    map_y = np.arange(height, dtype=np.float32)[:, None] + shift
+    return map_x, map_y
+
+
+def formula_grid(width, height):
+    """Координаты формулы для каждого пикселя: x от -10 до 10, y в том же масштабе"""
+    scale = (width - 1) / 20 if width > 1 else 1.0  # пикселей на единицу x
+    x = np.linspace(-10, 10, width)
+    y = (np.arange(height) - (height - 1) / 2) / scale
+    return x[None, :], y[:, None], scale
+
+
+def formula_values(formula, x, y):
+    """Значения координат, которые использует формула (r и theta - только при необходимости)"""
+    values = {'x': x, 'y': y}
+    if 'r' in formula.variables:
+        values['r'] = np.hypot(x, y)
+    if 'theta' in formula.variables:
+        values['theta'] = np.arctan2(y, x)
+    return {name: values[name] for name in formula.variables if name != 't'}
+
+
+def sample_grid(width, height, size):
+    """Координаты источника для центров пикселей результата размера size (как у cv2.resize)"""
+    out_w, out_h = size
+    src_x = ((np.arange(out_w) + 0.5) * width / out_w - 0.5).astype(np.float32)
+    src_y = ((np.arange(out_h) + 0.5) * height / out_h - 0.5).astype(np.float32)
+    return src_x, src_y
+
+
+def build_displacement_maps(formula, width, height):
+    """Таблицы remap для двумерных формул.
+
+    Одно выражение от x, y, r, theta - вертикальный сдвиг, нормированный как у y = f(x);
+    пара "dx, dy" - смещение по x и y в единицах формулы.
+    """
+    x, y, scale = formula_grid(width, height)
+    shape = (height, width)
+    result = formula(**formula_values(formula, x, y))
+    map_x = np.empty(shape, np.float32)
+    map_x[:] = np.arange(width, dtype=np.float32)
+    map_y = np.empty(shape, np.float32)
+    map_y[:] = np.arange(height, dtype=np.float32)[:, None]
+    if formula.is_vector:
+        dx, dy = (np.nan_to_num(np.broadcast_to(v, shape).astype(np.float32)) for v in result)
+        map_x += dx * scale
+        map_y += dy * scale
+    else:
+        map_y += _normalize_shift(np.broadcast_to(result, shape).astype(np.float32), height)
+    return map_x, map_y
+
+
+def build_maps(formula, width, height):
+    """Полноразмерные таблицы remap: для сдвига столбцов - быстрый одномерный путь"""
+    if formula.is_separable:
+        return build_column_shift_maps(formula, width, height)
+    return build_displacement_maps(formula, width, height)
+
+
+class FormulaMaps:
+    """Таблицы remap одной формулы в формате float32.
+
+    Статические таблицы строятся по запросу (кэш готовых таблиц - у
+    DistortionEngine), для анимированной формулы кэшируются не зависящие
+    от t части.
+    """
+
+    # Шаг сетки, на которой считается двумерное поле смещений анимированной формулы
+    animation_grid_step = 8
+
+    def __init__(self, formula):
+        self.formula = formula
+        # Как в RemapCache - только текущий размер: (ключ, данные) для полноразмерных
+        # таблиц (запись) и отдельно для области показа, иначе каждое изменение
+        # размера окна оставляло бы в памяти свои таблицы
+        self._animation_parts = {}
+        self._kept = {}
+
+    @staticmethod
+    def _slot(width, height, size):
+        return "full" if size == (width, height) else "display"
+
+    def maps(self, width, height, size, t=0.0, keep=False):
+        """Таблицы размера size для кадра width x height (keep - запомнить статические)"""
+        if self.formula.is_animated:
+            return self.animated_maps(width, height, size, t)
+        key, slot = (width, height, size), self._slot(width, height, size)
+        entry = self._kept.get(slot)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        maps = self.build(width, height, size)
+        if keep:
+            self._kept[slot] = (key, maps)
+        return maps
+
+    def xy_maps(self, width, height, t=0.0, keep=False):
+        """Полноразмерная таблица одним двухканальным массивом (x, y) - для сведения цепочки"""
+        if self.formula.is_animated:
+            return cv2.merge(self.animated_maps(width, height, (width, height), t))
+        key = (width, height)
+        entry = self._kept.get('xy')
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        maps = cv2.merge(self.build(width, height, (width, height)))
+        if keep:
+            self._kept['xy'] = (key, maps)
+        return maps
+
+    def build(self, width, height, size):
+        if size == (width, height):
+            return build_maps(self.formula, width, height)
+        if self.formula.is_separable:
+            # Сдвиг столбцов: интерполируем одномерный вектор, полная таблица не нужна
+            out_w, out_h = size
+            src_x, src_y = sample_grid(width, height, size)
+            shift = column_shift(self.formula, width, height)
+            map_x = np.empty((out_h, out_w), np.float32)
+            map_x[:] = src_x
+            map_y = src_y[:, None] + np.interp(src_x, np.arange(width), shift).astype(np.float32)
+            return map_x, map_y
+        map_x, map_y = build_maps(self.formula, width, height)
+        return cv2.resize(map_x, size), cv2.resize(map_y, size)
+
+    def _static_parts(self, width, height, size):
+        """Не зависящие от t части анимированной формулы: сетка, ось x, подвыражения без t"""
+        key, slot = (width, height, size), self._slot(width, height, size)
+        entry = self._animation_parts.get(slot)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        formula = self.formula
+        out_w, out_h = size
+        src_x, src_y = sample_grid(width, height, size)
+        map_x = np.empty((out_h, out_w), np.float32)
+        map_x[:] = src_x
+        if formula.is_separable:
+            values = {'x': np.linspace(-10, 10, width)} if 'x' in formula.variables else {}
+            parts = {'src_y': src_y, 'map_x': map_x, 'values': values,
+                     # Столбцы результата между столбцами источника (предпросмотр)
+                     'columns': None if out_w == width else src_x}
+        else:
+            step = self.animation_grid_step
+            low_w, low_h = max(2, width // step), max(2, height // step)
+            x, y, _ = formula_grid(low_w, low_h)
+            values = formula_values(formula, x, y)
+            parts = {'src_x': src_x, 'src_y': src_y, 'map_x': map_x, 'values': values,
+                     'scale': (width - 1) / 20 if width > 1 else 1.0, 'low_shape': (low_h, low_w)}
+        parts['values'].update(formula.invariants(**parts['values']))
+        self._animation_parts[slot] = (key, parts)
+        return parts
+
+    def animated_maps(self, width, height, size, t):
+        """Таблицы для формулы с t размера size: на кадр пересчитывается только малая часть.
+
+        Сдвиг столбцов - вектор длины width; двумерная формула - поле смещений
+        на сетке с шагом animation_grid_step, растянутое до нужного размера.
+        """
+        formula = self.formula
+        parts = self._static_parts(width, height, size)
+        if formula.is_separable:
+            shift = np.empty(width)
+            shift = _normalize_shift(formula(out=shift, t=t, **parts['values']), height)
+            if parts['columns'] is not None:
+                shift = np.interp(parts['columns'], np.arange(width), shift)
+            return parts['map_x'], parts['src_y'][:, None] + shift.astype(np.float32)
+
+        low_shape = parts['low_shape']
+        result = formula(t=t, **parts['values'])
+        if formula.is_vector:
+            dx, dy = (np.nan_to_num(np.broadcast_to(v, low_shape).astype(np.float32)) * parts['scale']
+                      for v in result)
+            map_x = cv2.resize(dx, size)
+            map_x += parts['src_x']
+        else:
+            dy = _normalize_shift(np.broadcast_to(result, low_shape).astype(np.float32), height)
+            map_x = parts['map_x']
+        map_y = cv2.resize(dy, size)
+        map_y += parts['src_y'][:, None]
+        return map_x, map_y
+
+
+class DistortionEngine:
+    """Применение эффектов к кадрам без интерфейса.
+
+    Формулы компилируются один раз. Цепочка эффектов ("a; b; ...") заранее
+    сводится в одну таблицу: таблица последнего эффекта указывает, где
+    брать пиксель в результате предыдущего, и т.д. до исходного кадра.
+    Сведённые таблицы кэшируются по размеру кадра, поэтому каждый кадр
+    стоит один вызов cv2.remap при любой длине цепочки.
+    """
+
+    # Полоса тоньше этого не окупает передачу задачи в пул
+    min_band_rows = 64
+
+    def __init__(self, formula=None, interpolation=cv2.INTER_LINEAR, fixed_point=True, workers=1,
+                 disk_cache=None):
+        self.interpolation = interpolation
+        # disk_cache (MapDiskCache) хранит полноразмерные таблицы между запусками;
+        # таблицы области показа меняются с размером окна и остаются только в памяти
+        self.cache = RemapCache(fixed_point=fixed_point, disk=disk_cache)
+        self.preview_cache = RemapCache(fixed_point=fixed_point)
+        self.effects = []
+        self.workers = 1
+        self._pool = None
+        self.set_formula(formula)
+        self.set_workers(workers)
+
+    def set_workers(self, workers):
+        """Число потоков, по полосам которых делится remap одного кадра (1 - без деления)"""
+        workers = max(1, int(workers or 1))
+        if self._pool is not None and workers != self.workers:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        if workers > 1 and self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=workers)
+        self.workers = workers
+
+    def shutdown(self):
+        self.set_workers(1)
+
+    def set_formula(self, formula):
+        """Принимает строку (эффекты через ';'), CompiledFormula, их список или None"""
+        if isinstance(formula, str):
+            formula = compile_chain(formula)
+        elif isinstance(formula, CompiledFormula):
+            formula = [formula]
+        self.effects = [FormulaMaps(f) for f in formula or ()]
+        # Ключ таблиц - нормализованный AST: "50 * sinh(x)" и "50*sinh(x)" совпадают
+        self.key = ";".join(ast.dump(effect.formula.tree) for effect in self.effects)
+        self.is_animated = any(effect.formula.is_animated for effect in self.effects)
+        self.cache.clear()
+        self.preview_cache.clear()
+
+    def _chain_maps(self, width, height, size, t=0.0):
+        """Сводит таблицы цепочки в одну (float32) размера size.
+
+        В анимированной цепочке статические эффекты запоминают свои таблицы,
+        чтобы на каждом кадре пересчитывались только эффекты с t.
+        """
+        keep = self.is_animated
+        maps = self.effects[-1].maps(width, height, size, t, keep=keep)
+        if len(self.effects) == 1:
+            return maps
+        # Дальше таблица хранится одним массивом CV_32FC2 - cv2.remap принимает его без map2
+        xy = cv2.merge(maps)
+        for effect in reversed(self.effects[:-1]):
+            # Берём координату из таблицы предыдущего эффекта в точке, куда указывает текущая
+            inner = effect.xy_maps(width, height, t, keep=keep)
+            xy = cv2.remap(inner, xy, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return xy, None
+
+    def _remap(self, frame, map1, map2, out=None):
+        """cv2.remap, при workers > 1 - горизонтальными полосами в пуле потоков.
+
+        Строка результата зависит только от той же строки таблиц, поэтому
+        полосы независимы: каждая режет свои строки map1/map2 и пишет прямо
+        в свою часть заранее выделенного out. Исходный кадр общий и только
+        читается - перекрытие (halo) строк не нужно даже для формул от y.
+        """
+        height = map1.shape[0]
+        bands = min(self.workers, height // self.min_band_rows)
+        if bands <= 1:
+            return cv2.remap(frame, map1, map2, dst=out, interpolation=self.interpolation,
+                             borderMode=cv2.BORDER_REPLICATE)
+        if out is None:
+            out = np.empty(map1.shape[:2] + frame.shape[2:], frame.dtype)
+        bounds = np.linspace(0, height, bands + 1).astype(int)
+        futures = [self._pool.submit(self._remap_band, frame, map1, map2, out, top, bottom)
+                   for top, bottom in zip(bounds[:-1], bounds[1:])]
+        for future in futures:
+            future.result()
+        return out
+
+    def _remap_band(self, frame, map1, map2, out, top, bottom):
+        cv2.remap(frame, map1[top:bottom], None if map2 is None else map2[top:bottom],
+                  dst=out[top:bottom], interpolation=self.interpolation,
+                  borderMode=cv2.BORDER_REPLICATE)
+
+    def maps(self, width, height):
+        key = (self.key, width, height, self.interpolation)
+        return self.cache.get(key, lambda: self._chain_maps(width, height, (width, height)))
+
+    def distort(self, frame, t=0.0, out=None):
+        if not self.effects:
+            return frame
+        height, width = frame.shape[:2]
+        if self.is_animated:
+            map1, map2 = self._chain_maps(width, height, (width, height), t)
+        else:
+            map1, map2 = self.maps(width, height)
+        return self._remap(frame, map1, map2, out)
+
+    def preview_maps(self, width, height, size):
+        """Таблицы, переводящие пиксели области показа сразу в пиксели исходного кадра.
+
+        Значение в точке (u, v) - координата источника для пикселя
+        (u*w/W, v*h/H) полноразмерного результата.
+        """
+        key = (self.key, width, height, size, self.interpolation)
+        return self.preview_cache.get(key, lambda: self._chain_maps(width, height, size))
+
+    def preview(self, frame, display_size, t=0.0):
+        """Эффект и масштабирование под область показа за один проход remap"""
+        height, width = frame.shape[:2]
+        size = fit_size(width, height, *display_size)
+        if not self.effects:
+            return cv2.resize(frame, size)
+        if self.is_animated:
+            map1, map2 = self._chain_maps(width, height, size, t)
+        else:
+            map1, map2 = self.preview_maps(width, height, size)
+        return self._remap(frame, map1, map2)
+
+
+# Готовые формулы: сетка предпросмотра (к ним добавляется текущая формула) и пресеты
+GRID_FORMULAS = [
+    "50*sinh(x)",
+    "20*sin(x)",
+    "x**2",
+    "10*log(x)*sqrt(x)",
+    "20*sin(y)",
+    "x*(r/10-1), y*(r/10-1)",
+    "2*sin(r)*cos(theta), 2*sin(r)*sin(theta)",
+    "50*sin(x + t)",
+    "20*tanh(x); 20*sin(y)",
+]
+
+
+def load_presets(path):
+    """Готовые формулы и сохранённые пользователем (JSON-список строк в path)"""
+    presets = list(GRID_FORMULAS)
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = []
+    return presets + [p for p in saved if isinstance(p, str) and p not in presets]
+
+
+def save_presets(path, presets):
+    """Записывает пользовательские пресеты (кроме встроенных)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([p for p in presets if p not in GRID_FORMULAS], f, ensure_ascii=False, indent=2)
+
+
+class PreviewGrid:
+    """Предпросмотр нескольких формул на одном кадре.
+
+    Каждая плитка - свой DistortionEngine с таблицами размера миниатюры;
+    плитки считаются параллельно в пуле потоков (cv2.remap отпускает GIL)
+    и пишутся каждая в свою часть общего кадра.
+    """
+
+    def __init__(self, formulas, workers=None):
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4)
+        self.tiles = []
+        self.set_formulas(formulas)
+
+    def set_formulas(self, formulas):
+        tiles = []
+        for formula in formulas:
+            try:
+                tiles.append((formula, DistortionEngine(formula)))
+            except FormulaError as e:
+                print(f"Формула '{formula}' пропущена: {e}")
+        self.tiles = tiles
+
+    def layout(self, size):
+        """(столбцов, строк, ширина плитки, высота плитки) для области size"""
+        count = max(1, len(self.tiles))
+        cols = math.ceil(math.sqrt(count))
+        rows = math.ceil(count / cols)
+        return cols, rows, size[0] // cols, size[1] // rows
+
+    def render(self, frame, size, t=0.0):
+        """Кадр BGR размера size с миниатюрами всех формул"""
+        cols, rows, tile_w, tile_h = self.layout(size)
+        canvas = np.zeros((size[1], size[0], 3), np.uint8)
+        tiles = self.tiles
+        futures = [self.pool.submit(self._render_tile, canvas, i, formula, engine, frame,
+                                    cols, tile_w, tile_h, t)
+                   for i, (formula, engine) in enumerate(tiles)]
+        wait(futures)
+        return canvas
+
+    @staticmethod
+    def _render_tile(canvas, index, formula, engine, frame, cols, tile_w, tile_h, t):
+        thumb = engine.preview(frame, (tile_w - 2, tile_h - 2), t)
+        h, w = thumb.shape[:2]
+        top = (index // cols) * tile_h + (tile_h - h) // 2
+        left = (index % cols) * tile_w + (tile_w - w) // 2
+        canvas[top:top + h, left:left + w] = thumb
+        cv2.putText(canvas, formula, (left + 4, top + h - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                    (0, 255, 255), 1, cv2.LINE_AA)
+
+    def tile_at(self, size, x, y):
+        """Формула плитки под точкой (x, y) области size или None"""
+        cols, rows, tile_w, tile_h = self.layout(size)
+        if not (0 <= x < cols * tile_w and 0 <= y < rows * tile_h):
+            return None
+        index = (y // tile_h) * cols + x // tile_w
+        return self.tiles[index][0] if index < len(self.tiles) else None
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+
+class FramePool:
+    """Переиспользуемые выходные кадры полного размера для DistortionEngine.distort(out=...).
+
+    Готовый кадр уходит в очереди записи, буфера повтора и трансляции,
+    поэтому один буфер не годится. Буфер выдаётся снова, только когда
+    на него не осталось ссылок вне пула (все очереди его отпустили); если
+    свободных нет, выделяется новый кадр без пула - данные не затираются.
+    """
+
+    def __init__(self, size=8):
+        self.size = size
+        self._buffers = []
+        self._lock = threading.Lock()
+
+    def get(self, shape, dtype=np.uint8):
+        with self._lock:
+            # Размер кадра сменился - старые буферы больше не нужны
+            self._buffers = [b for b in self._buffers if b.shape == shape and b.dtype == dtype]
+            for buf in self._buffers:
+                # Ссылки: список пула, переменная цикла и аргумент getrefcount
+                if sys.getrefcount(buf) == 3:
+                    return buf
+            buf = np.empty(shape, dtype)
+            if len(self._buffers) < self.size:
+                self._buffers.append(buf)
+            return buf
+
+
+class StageStats:
+    """Лёгкие замеры этапов обработки кадра: скользящие перцентили и частоты.
+
+    Потокобезопасен: этапы меряются в потоках захвата, обработки, кодирования и Tk.
+    """
+
+    STAGES = ("capture", "distort", "write", "replay", "stream", "preview", "grid", "convert", "blit")
+
+    def __init__(self, window=300):
+        self.window = window
+        self._samples = {}  # этап -> deque длительностей (с)
+        self._ticks = {}    # поток кадров -> deque меток времени
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def measure(self, stage):
+        return _StageTimer(self, stage)
+
+    def tick(self, name):
+        """Отмечает кадр в потоке name ("capture", "display") для подсчёта FPS"""
+        with self._lock:
+            ticks = self._ticks.get(name)
+            if ticks is None:
+                ticks = self._ticks[name] = deque(maxlen=self.window)
+            ticks.append(time.monotonic())
+
+    def fps(self, name):
+        with self._lock:
+            ticks = list(self._ticks.get(name, ()))
+        if len(ticks) < 2 or ticks[-1] <= ticks[0]:
+            return 0.0
+        return (len(ticks) - 1) / (ticks[-1] - ticks[0])
+
+    def snapshot(self):
+        """Словарь {stages: {этап: {count, p50, p95, p99}} (мс), fps: {...}}"""
+        with self._lock:
+            samples = {stage: np.array(values) for stage, values in self._samples.items() if values}
+            names = list(self._ticks)
+        stages = {}
+        order = lambda s: (self.STAGES.index(s) if s in self.STAGES else len(self.STAGES), s)
+        for stage in sorted(samples, key=order):
+            p50, p95, p99 = np.percentile(samples[stage] * 1000, (50, 95, 99))
+            stages[stage] = {"count": len(samples[stage]), "p50": round(float(p50), 3),
+                             "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+        return {"time": datetime.now().isoformat(timespec="seconds"), "stages": stages,
+                "fps": {name: round(self.fps(name), 2) for name in names}}
+
+    def summary_lines(self):
+        snap = self.snapshot()
+        lines = ["  ".join(f"{name} {fps:.1f} FPS" for name, fps in snap["fps"].items())]
+        for stage, st in snap["stages"].items():
+            lines.append(f"{stage:<8} p50 {st['p50']:6.2f}  p95 {st['p95']:6.2f}  p99 {st['p99']:6.2f} ms")
+        return lines
+
+    def export(self, path):
+        """Дописывает снимок в журнал: .csv - строка на этап, иначе JSON Lines"""
+        snap = self.snapshot()
+        if path.lower().endswith(".csv"):
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["time", "stage", "count", "p50_ms", "p95_ms", "p99_ms", "fps"])
+                for stage, st in snap["stages"].items():
+                    writer.writerow([snap["time"], stage, st["count"], st["p50"], st["p95"], st["p99"], ""])
+                for name, fps in snap["fps"].items():
+                    writer.writerow([snap["time"], f"fps_{name}", "", "", "", "", fps])
+        else:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(snap) + "\n")
+
+
+class _StageTimer:
+    __slots__ = ("stats", "stage", "start")
+
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.stats.record(self.stage, time.perf_counter() - self.start)
+
+
+def _measure(stats, stage):
+    return stats.measure(stage) if stats is not None else nullcontext()
+
+
+def fit_size(width, height, area_width, area_height):
+    """Размер кадра, вписанного в область с сохранением пропорций"""
+    ratio = min(area_width/width, area_height/height)
+    return int(width*ratio), int(height*ratio)
+
+
+def bgr_to_pil(frame):
+    """Кадр BGR -> PIL RGB: каналы меняются местами при копировании в PIL, без cvtColor"""
+    h, w = frame.shape[:2]
+    return Image.frombuffer("RGB", (w, h), np.ascontiguousarray(frame), "raw", "BGR", 0, 1)
+
+
+def put_with_policy(q, item, policy):
+    """Кладёт элемент в ограниченную очередь согласно политике переполнения.
+
+    "latest" - при переполнении выбрасывается самый старый элемент (побеждает свежий кадр),
+    "block"  - производитель ждёт свободного места.
+    Возвращает количество выброшенных элементов.
+    """
+    if policy == "block":
+        q.put(item)
+        return 0
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+class FramePipeline:
+    """Конвейер захват -> обработка -> отображение.
+
+    Поток захвата читает кадры через read_frame() и кладёт их в ограниченную
+    очередь; несколько рабочих потоков (cv2.remap отпускает GIL) вызывают
+    process_frame(frame, timestamp). Отображение забирает только самый
+    свежий готовый результат через latest().
+    """
+
+    def __init__(self, read_frame, process_frame, workers=2, queue_size=2, drop_policy="latest",
+                 stats=None):
+        self.stats = stats
+        self.read_frame = read_frame
+        self.process_frame = process_frame
+        self.workers = max(1, workers)
+        self.drop_policy = drop_policy
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._running = False
+        self._threads = []
+        self._lock = threading.Lock()
+        self._latest = None  # (seq, result)
+        self._capture_times = deque(maxlen=60)
+        self.captured = 0
+        self.processed = 0
+        self.dropped = 0
+
+    def start(self):
+        self._running = True
+        self._threads = [threading.Thread(target=self._capture_loop, daemon=True)]
+        self._threads += [threading.Thread(target=self._process_loop, daemon=True)
+                          for _ in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=1.0):
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def latest(self):
+        """Возвращает (seq, result) самого свежего обработанного кадра или None"""
+        return self._latest
+
+    def capture_fps(self):
+        """Частота захвата по меткам времени последних кадров (None, если кадров мало)"""
+        times = list(self._capture_times)
+        if len(times) < 2 or times[-1] <= times[0]:
+            return None
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def _capture_loop(self):
+        seq = 0
+        while self._running:
+            try:
+                with _measure(self.stats, "capture"):
+                    ret, frame = self.read_frame()
+            except Exception as e:
+                print(f"Ошибка захвата кадра: {e}")
+                ret = False
+            if not ret:
+                time.sleep(0.1)
+                continue
+            seq += 1
+            self.captured += 1
+            timestamp = time.monotonic()
+            self._capture_times.append(timestamp)
+            if self.stats is not None:
+                self.stats.tick("capture")
+            self.dropped += put_with_policy(self._queue, (seq, timestamp, frame), self.drop_policy)
+
+    def _process_loop(self):
+        while self._running:
+            try:
+                seq, timestamp, frame = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                result = self.process_frame(frame, timestamp, seq)
+            except Exception as e:
+                print(f"Ошибка обработки кадра: {e}")
+                continue
+            with self._lock:
+                self.processed += 1
+                if self._latest is None or seq > self._latest[0]:
+                    self._latest = (seq, result)
+
+
+class VideoEncoder:
+    """Запись видео в отдельном потоке кодирования.
+
+    Кадры с метками времени захвата поступают в ограниченную очередь. Каждый
+    кадр ставится на временную шкалу файла (индекс = (t - t0) * fps): пропуски
+    заполняются повтором предыдущего кадра, опоздавшие кадры выбрасываются,
+    поэтому длительность видео совпадает с реальной.
+
+    Рабочие потоки конвейера могут сдать кадры не в порядке захвата, поэтому
+    перед шкалой стоит буфер из reorder кадров, упорядоченный по номеру seq:
+    кадр пишется, только когда за ним накопилось reorder более новых.
+    """
+
+    def __init__(self, writer, fps, queue_size=60, start_time=None, stats=None, reorder=2):
+        # writer - cv2.VideoWriter или любой объект с write/release/isOpened (например FFmpegWriter)
+        self.writer = writer
+        # Не меньше числа рабочих потоков конвейера: кадр обгоняют не больше чем они
+        self.reorder = reorder
+        self.stats = stats
+        self.fps = fps
+        self.start_time = start_time
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self.queued = 0
+        self.written = 0
+        self.duplicated = 0
+        self.dropped = 0
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, timestamp, block=False, seq=None):
+        """Ставит кадр в очередь; при переполнении кадр выбрасывается (кодер не успевает).
+
+        seq - номер кадра в порядке захвата (без него порядок задаёт метка времени).
+        block=True ждёт места в очереди - для записи уже готовых кадров, а не живого потока.
+        """
+        try:
+            self._queue.put((timestamp if seq is None else seq, timestamp, frame), block)
+            self.queued += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stop(self):
+        """Дописывает оставшиеся в очереди кадры и закрывает файл"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.writer.release()
+
+    def stats_text(self, tr):
+        return (f"{tr('queued')}: {self.queued}  {tr('written')}: {self.written}  "
+                f"{tr('dropped')}: {self.dropped}")
+
+    def _run(self):
+        self._next_index = 0
+        self._previous = None
+        pending = []  # Куча (seq, метка времени, кадр)
+        last_key = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if last_key is not None and item[0] <= last_key:
+                self.dropped += 1  # Опоздал больше, чем на окно упорядочивания
+                continue
+            heapq.heappush(pending, item)
+            while len(pending) > self.reorder:
+                last_key, timestamp, frame = heapq.heappop(pending)
+                self._place(frame, timestamp)
+        while pending:
+            _, timestamp, frame = heapq.heappop(pending)
+            self._place(frame, timestamp)
+
+    def _place(self, frame, timestamp):
+        """Ставит кадр на временную шкалу файла"""
+        if self.start_time is None:
+            self.start_time = timestamp
+        index = round((timestamp - self.start_time) * self.fps)
+        if index < self._next_index:
+            self.dropped += 1  # Место кадра на шкале уже занято
+            return
+        # Заполняем пропуск повтором предыдущего кадра
+        while self._next_index < index and self._previous is not None:
+            with _measure(self.stats, "write"):
+                self.writer.write(self._previous)
+            self.duplicated += 1
+            self.written += 1
+            self._next_index += 1
+        with _measure(self.stats, "write"):
+            self.writer.write(frame)
+        self.written += 1
+        self._next_index = index + 1
+        self._previous = frame
+
+
+class AudioRingBuffer:
+    """Предвыделенный кольцевой буфер сэмплов для одного писателя и одного читателя.
+
+    Писатель (callback звуковой карты) никогда не ждёт: если читатель
+    не успевает, не поместившиеся сэмплы выбрасываются и учитываются в overflows.
+    """
+
+    def __init__(self, seconds, samplerate, channels, dtype=np.int16):
+        self.capacity = int(seconds * samplerate)
+        self._data = np.zeros((self.capacity, channels), dtype=dtype)
+        self._written = 0  # Всего записано сэмплов (монотонный счётчик)
+        self._read = 0     # Всего прочитано сэмплов
+        self.overflows = 0
+
+    def write(self, block):
+        free = self.capacity - (self._written - self._read)
+        if len(block) > free:
+            self.overflows += 1
+            block = block[:free]
+        start = self._written % self.capacity
+        first = min(len(block), self.capacity - start)
+        self._data[start:start + first] = block[:first]
+        self._data[:len(block) - first] = block[first:]
+        self._written += len(block)
+
+    def read(self):
+        """Забирает все накопленные сэмплы одним непрерывным массивом"""
+        written = self._written
+        count = written - self._read
+        start = self._read % self.capacity
+        first = min(count, self.capacity - start)
+        data = np.concatenate((self._data[start:start + first], self._data[:count - first]))
+        self._read = written
+        return data
+
+
+# Форматы фото: расширение и параметр качества cv2.imwrite (для PNG качество не используется)
+PHOTO_FORMATS = {
+    "JPEG": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "PNG": (".png", None),
+    "WebP": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+class PhotoSaver:
+    """Сохранение фото в пуле потоков, чтобы цикл Tk не ждал кодирования.
+
+    save() возвращает сразу; process (например, полноразмерный эффект)
+    и cv2.imwrite выполняются в пуле, а callback(filename, error) вызывается
+    из потока пула по завершении.
+    """
+
+    def __init__(self, workers=2):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._names = set()  # Уже выданные имена - на случай двух снимков в одну миллисекунду
+
+    def unique_name(self, folder, prefix, fmt, suffix=""):
+        """prefix_ГГГГММДД_ЧЧММСС_мс[suffix].ext, без совпадения с уже выданными"""
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        ext = PHOTO_FORMATS[fmt][0]
+        with self._lock:
+            name, n = f"{prefix}_{stamp}{suffix}", 1
+            while name in self._names or os.path.exists(os.path.join(folder, name + ext)):
+                name, n = f"{prefix}_{stamp}{suffix}_{n}", n + 1
+            self._names.add(name)
+        return os.path.join(folder, name + ext)
+
+    def save(self, frame, filename, fmt="JPEG", quality=95, process=None, callback=None):
+        return self.pool.submit(self._save, frame, filename, fmt, quality, process, callback)
+
+    @staticmethod
+    def _save(frame, filename, fmt, quality, process, callback):
+        error = None
+        try:
+            if process is not None:
+                frame = process(frame)
+            param = PHOTO_FORMATS[fmt][1]
+            params = [param, int(quality)] if param is not None else []
+            if not cv2.imwrite(filename, frame, params):
+                raise RuntimeError(f"cv2.imwrite не записал {filename}")
+        except Exception as e:
+            error = e
+        if callback is not None:
+            callback(filename, error)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class ReplayBuffer:
+    """Последние seconds секунд кадров в JPEG для сохранения задним числом.
+
+    Кадры сжимаются в отдельном потоке и складываются подряд в заранее
+    выделенный байтовый массив размера max_bytes; при нехватке места или
+    по возрасту вытесняются самые старые кадры, поэтому память не растёт.
+    submit не ждёт: если кодер не успевает, кадр выбрасывается.
+
+    Сохранение не копирует буфер целиком: snapshot() запоминает только
+    номера и метки кадров, а frames() в фоновом потоке копирует их по одному
+    (кадр, уже вытесненный к этому моменту, пропускается).
+    """
+
+    def __init__(self, seconds=30.0, max_bytes=128 * 1024 * 1024, quality=85, queue_size=4, stats=None):
+        self.seconds = seconds
+        self.quality = quality
+        self.stats = stats
+        self._data = np.empty(max_bytes, np.uint8)
+        self._index = deque()  # (метка времени, смещение, длина) в порядке записи
+        self._pos = 0
+        self._appended = 0  # Всего добавлено кадров: номер самого старого = _appended - len(_index)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self.dropped = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, frame, timestamp):
+        try:
+            self._queue.put_nowait((frame, timestamp))
+        except queue.Full:
+            self.dropped += 1
+
+    def duration(self):
+        with self._lock:
+            return self._index[-1][0] - self._index[0][0] if self._index else 0.0
+
+    def snapshot(self):
+        """Номера и метки времени кадров в буфере: [(номер, метка), ...] от старых к новым"""
+        with self._lock:
+            first = self._appended - len(self._index)
+            return [(first + i, entry[0]) for i, entry in enumerate(self._index)]
+
+    def read(self, frame_id):
+        """bytes JPEG кадра с номером frame_id или None, если он уже вытеснен"""
+        with self._lock:
+            i = frame_id - (self._appended - len(self._index))
+            if i < 0:
+                return None
+            _, offset, length = self._index[i]
+            return self._data[offset:offset + length].tobytes()
+
+    def frames(self, snapshot):
+        """Кадры снимка snapshot() по одному: (метка времени, bytes JPEG)"""
+        for frame_id, timestamp in snapshot:
+            jpeg = self.read(frame_id)
+            if jpeg is not None:
+                yield timestamp, jpeg
+
+    def _run(self):
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame, timestamp = item
+            with _measure(self.stats, "replay"):
+                ok, jpeg = cv2.imencode(".jpg", frame, params)
+            if ok:
+                self._append(jpeg.ravel(), timestamp)
+
+    def _append(self, jpeg, timestamp):
+        size = len(jpeg)
+        capacity = len(self._data)
+        if size > capacity:
+            self.dropped += 1
+            return
+        with self._lock:
+            index = self._index
+            if self._pos + size > capacity:
+                # Хвост массива не вмещает кадр: освобождаем его и пишем с начала
+                while index and index[0][1] >= self._pos:
+                    index.popleft()
+                self._pos = 0
+            start, end = self._pos, self._pos + size
+            while index and index[0][1] < end and index[0][1] + index[0][2] > start:
+                index.popleft()
+            while index and index[0][0] < timestamp - self.seconds:
+                index.popleft()
+            self._data[start:end] = jpeg
+            index.append((timestamp, start, size))
+            self._appended += 1
+            self._pos = end
+
+
+class AudioReplay:
+    """Последние seconds секунд звука с микрофона для ReplayBuffer.
+
+    В отличие от AudioRingBuffer читателя нет: новые сэмплы затирают старые,
+    а clip вырезает отрезок по тем же монотонным часам, что и у кадров.
+    """
+
+    def __init__(self, seconds, samplerate=44100, channels=2, blocksize=1024):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self._data = np.zeros((int(seconds * samplerate), channels), np.int16)
+        self._written = 0
+        self._last_time = None  # time.monotonic() конца последнего блока
+        self._lock = threading.Lock()
+        self.stream = None
+
+    def start(self):
+        self.stream = _load_sounddevice().InputStream(
+            samplerate=self.samplerate, channels=self.channels, dtype='int16',
+            blocksize=self.blocksize, callback=self._callback)
+        self.stream.start()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def _callback(self, indata, frames, time_info, status):
+        capacity = len(self._data)
+        block = indata[-capacity:]
+        with self._lock:
+            start = self._written % capacity
+            first = min(len(block), capacity - start)
+            self._data[start:start + first] = block[:first]
+            self._data[:len(block) - first] = block[first:]
+            self._written += frames
+            self._last_time = time.monotonic()
+
+    def clip(self, start_time, end_time):
+        """Сэмплы за [start_time, end_time); то, чего уже (или ещё) нет в буфере, - тишина"""
+        count = max(0, round((end_time - start_time) * self.samplerate))
+        result = np.zeros((count, self.channels), np.int16)
+        with self._lock:
+            if self._last_time is None:
+                return result
+            capacity = len(self._data)
+            end = self._written - round((self._last_time - end_time) * self.samplerate)
+            start = end - count
+            lo, hi = max(start, self._written - capacity, 0), min(end, self._written)
+            if lo < hi:
+                positions = np.arange(lo, hi) % capacity
+                result[lo - start:hi - start] = self._data[positions]
+        return result
+
+
+def open_wav(filename, samplerate=44100, channels=2):
+    """Открывает WAV (int16) для дозаписи блоками"""
+    wf = wave.open(filename, 'wb')
+    wf.setnchannels(channels)
+    wf.setsampwidth(2)
+    wf.setframerate(samplerate)
+    return wf
+
+
+class AudioRecorder:
+    """Запись звука по мере поступления.
+
+    sd.InputStream в режиме callback кладёт блоки в AudioRingBuffer, поток
+    записи периодически сливает буфер в sink (объект с writeframes/close,
+    например wave.Wave_write). Память не растёт с длительностью записи,
+    а остановка дописывает не больше одного буфера.
+
+    Если задан start_time (time.monotonic() начала записи), звук выравнивается
+    по этому общему с видео моменту: перед первым сэмплом добавляется тишина
+    (или отбрасываются сэмплы, пришедшие раньше).
+    """
+
+    def __init__(self, sink, samplerate=44100, channels=2, blocksize=1024, buffer_seconds=2.0,
+                 start_time=None):
+        self.sink = sink
+        self.start_time = start_time
+        self.first_sample_time = None
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.ring = AudioRingBuffer(buffer_seconds, samplerate, channels)
+        self.stream = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.samples_written = 0
+
+    def start(self):
+        try:
+            self.stream = _load_sounddevice().InputStream(
+                samplerate=self.samplerate,
+                channels=self.channels,
+                dtype='int16',  # Используем int16 для совместимости с WAV
+                blocksize=self.blocksize,
+                device=None,
+                callback=self._callback)
+        except Exception:
+            self.sink.close()
+            raise
+        self._thread = threading.Thread(target=self._drain_loop, daemon=True)
+        self._thread.start()
+        self.stream.start()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self._drain()
+        finally:
+            self.sink.close()
+        if self.ring.overflows:
+            print(f"Audio overflow! ({self.ring.overflows})")
+
+    def _callback(self, indata, frames, time_info, status):
+        if self.first_sample_time is None:
+            # Момент первого сэмпла блока по тем же монотонным часам, что и у кадров
+            self.first_sample_time = time.monotonic() - frames / self.samplerate
+        if status.input_overflow:
+            self.ring.overflows += 1
+        self.ring.write(indata)
+
+    def _drain(self):
+        data = self.ring.read()
+        if self.start_time is not None and self.samples_written == 0 and len(data):
+            offset = round((self.first_sample_time - self.start_time) * self.samplerate)
+            if offset > 0:
+                self.sink.writeframes(bytes(offset * self.channels * 2))
+                self.samples_written += offset
+            else:
+                data = data[-offset:]
+        if len(data):
+            self.sink.writeframes(data.tobytes())
+            self.samples_written += len(data)
+
+    def _drain_loop(self):
+        while not self._stop_event.wait(0.1):
+            self._drain()
+
+
+def find_ffmpeg():
+    """Путь к локально установленному ffmpeg или None"""
+    return shutil.which("ffmpeg")
+
+
+class SocketAudioSink:
+    """Приёмник звука для ffmpeg: сэмплы s16le отдаются через локальный TCP-сокет.
+
+    Сокет работает одинаково на Windows и Linux, в отличие от дополнительных
+    файловых дескрипторов или именованных каналов.
+    """
+
+    def __init__(self, accept_timeout=10.0):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.server.settimeout(0.1)  # accept ждёт короткими шагами, чтобы видеть disable()
+        self.accept_timeout = accept_timeout
+        self.port = self.server.getsockname()[1]
+        self.conn = None
+        self.disabled = False
+
+    def disable(self):
+        """ffmpeg не запустился: звук больше не ждёт подключения и выбрасывается"""
+        self.disabled = True
+
+    def _accept(self):
+        deadline = time.monotonic() + self.accept_timeout
+        while self.conn is None and not self.disabled:
+            try:
+                self.conn, _ = self.server.accept()
+            except socket.timeout:
+                if time.monotonic() > deadline:
+                    raise
+
+    def writeframes(self, data):
+        self._accept()
+        if self.conn is not None:
+            self.conn.sendall(data)
+
+    def close(self):
+        try:
+            self._accept()  # ffmpeg мог подключиться, но ещё ничего не получить
+        except OSError:
+            pass
+        if self.conn is not None:
+            self.conn.close()
+        self.server.close()
+
+
+class FFmpegWriter:
+    """Запись видео и звука в один файл через процесс ffmpeg.
+
+    Кадры (bgr24) идут в stdin, звук - через SocketAudioSink. Обе дорожки
+    привязаны к одному моменту начала: видео выравнивается по шкале кадров
+    в VideoEncoder, звук - тишиной в начале в AudioRecorder, поэтому файл
+    синхронизирован без последующей обработки.
+    """
+
+    def __init__(self, filename, frame_size, fps, audio_sink=None, samplerate=44100, channels=2):
+        width, height = frame_size
+        cmd = [find_ffmpeg() or "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+               "-thread_queue_size", "512",
+               "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}",
+               "-framerate", f"{fps:.3f}", "-i", "pipe:0"]
+        if audio_sink is not None:
+            # Без анализа потока: формат задан явно, а пока ffmpeg анализирует звук
+            # (по умолчанию до 5 с), он не читает кадры из stdin
+            cmd += ["-thread_queue_size", "512", "-analyzeduration", "0", "-probesize", "32",
+                    "-f", "s16le", "-ar", str(samplerate), "-ac", str(channels),
+                    "-i", f"tcp://127.0.0.1:{audio_sink.port}"]
+        cmd += ["-map", "0:v"]
+        if audio_sink is not None:
+            cmd += ["-map", "1:a", "-c:a", "pcm_s16le"]
+        cmd += ["-c:v", "mjpeg", "-q:v", "3", "-pix_fmt", "yuvj420p", filename]
+        try:
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except OSError as e:
+            print(f"Не удалось запустить ffmpeg: {e}")
+            self.proc = None
+            if audio_sink is not None:
+                audio_sink.disable()
+
+    def isOpened(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def write(self, frame):
+        try:
+            self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError) as e:
+            print(f"Ошибка записи в ffmpeg: {e}")
+
+    def release(self):
+        """Закрывает видеодорожку (EOF для ffmpeg)"""
+        if self.proc is not None and not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+
+    def finish(self, timeout=10.0):
+        """Ждёт, пока ffmpeg допишет файл (после закрытия обеих дорожек)"""
+        if self.proc is None:
+            return
+        self.release()
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            print("ffmpeg не завершился вовремя и был остановлен")
+
+
+class StreamClient:
+    """Счётчики одного зрителя MJPEGServer"""
+
+    def __init__(self, address):
+        self.address = f"{address[0]}:{address[1]}"
+        self.connected = time.monotonic()
+        self.frames = 0
+        self.skipped = 0  # Кадры, пропущенные, пока клиент принимал предыдущий
+        self.bytes = 0
+        self.seq = 0           # Номер последнего отправленного кадра
+        self.frame_time = 0.0  # Метка захвата последнего отправленного кадра
+        self.delivery = 0.0    # От захвата этого кадра до конца его отправки, с
+
+    def lag(self, latest_time):
+        """Отставание от свежего кадра: растёт, пока клиент не принимает данные"""
+        return self.delivery + max(0.0, latest_time - self.frame_time)
+
+
+class _MJPEGHandler(BaseHTTPRequestHandler):
+    server_version = "ReDisCa"
+    timeout = 10  # Зависший клиент отключается, а не держит поток вечно
+
+    def do_GET(self):
+        owner = self.server.owner
+        path = self.path.split("?")[0]
+        if path == "/":
+            self._send(b'<html><body style="margin:0;background:#000">'
+                       b'<img src="/stream" style="width:100%"></body></html>', "text/html")
+        elif path == "/stream":
+            owner._stream(self)
+        elif path == "/stats":
+            self._send(json.dumps(owner.snapshot()).encode(), "application/json")
+        else:
+            self.send_error(404)
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Без строки в консоли на каждый запрос
+
+
+class MJPEGServer:
+    """HTTP-трансляция кадров эффекта в формате MJPEG (multipart/x-mixed-replace).
+
+    Кадр сжимается в JPEG один раз в отдельном потоке, и одни и те же байты
+    отдаются всем зрителям. Каждый зритель берёт самый свежий кадр: пока
+    медленный клиент принимает предыдущий, промежуточные кадры для него
+    пропускаются, поэтому ничего не копится в памяти. Адреса: / - страница
+    с потоком, /stream - сам поток, /stats - счётчики в JSON.
+    """
+
+    boundary = b"frame"
+
+    def __init__(self, host="127.0.0.1", port=8080, quality=80, stats=None):
+        self.quality = quality
+        self.stats = stats
+        self.httpd = ThreadingHTTPServer((host, port), _MJPEGHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self.address = self.httpd.server_address
+        self.clients = {}
+        self.egress = 0  # Всего отправлено байт (включая отключившихся зрителей)
+        self._frame = (0, 0.0, b"")  # (номер, метка времени захвата, JPEG)
+        self._cond = threading.Condition()
+        self._queue = queue.Queue(maxsize=1)
+        self._running = False
+        self._threads = []
+
+    @property
+    def url(self):
+        return f"http://{self.address[0]}:{self.address[1]}/"
+
+    def start(self):
+        self._running = True
+        self._threads = [threading.Thread(target=self.httpd.serve_forever, daemon=True),
+                         threading.Thread(target=self._encode_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        # Ждущий кадр вытесняется: блокирующий put в полную очередь мог не дождаться места
+        put_with_policy(self._queue, None, "latest")
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+
+    def submit(self, frame, timestamp):
+        """Передаёт кадр на сжатие; без зрителей не делает ничего, старый кадр вытесняется"""
+        if self.clients:
+            put_with_policy(self._queue, (frame, timestamp), "latest")
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._cond:
+            clients = list(self.clients.values())
+            egress = self.egress
+            latest_seq, latest_time = self._frame[:2]
+        return {
+            "egress_bytes": egress,
+            "clients": [{"address": c.address, "frames": c.frames, "skipped": c.skipped,
+                         "behind": latest_seq - c.seq if c.seq else 0, "bytes": c.bytes,
+                         "lag_ms": round(c.lag(latest_time) * 1000, 1),
+                         "seconds": round(now - c.connected, 1)} for c in clients],
+        }
+
+    def stats_text(self, tr):
+        snap = self.snapshot()
+        lags = [c["lag_ms"] for c in snap["clients"]]
+        text = f"{self.url}  {tr('viewers')}: {len(lags)}  {snap['egress_bytes'] / 1e6:.1f} MB"
+        if lags:
+            text += f"  {tr('lag')}: {max(lags):.0f} ms"
+        return text
+
+    def _encode_loop(self):
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame, timestamp = item
+            with _measure(self.stats, "stream"):
+                ok, jpeg = cv2.imencode(".jpg", frame, params)
+            if not ok:
+                continue
+            with self._cond:
+                self._frame = (self._frame[0] + 1, timestamp, jpeg.tobytes())
+                self._cond.notify_all()
+
+    def _stream(self, handler):
+        client = StreamClient(handler.client_address)
+        with self._cond:
+            self.clients[id(client)] = client
+        try:
+            handler.send_response(200)
+            handler.send_header("Content-Type",
+                                "multipart/x-mixed-replace; boundary=" + self.boundary.decode())
+            handler.send_header("Cache-Control", "no-cache")
+            handler.end_headers()
+            last = self._frame[0]
+            while self._running:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._frame[0] != last or not self._running, timeout=1.0)
+                    seq, timestamp, data = self._frame
+                if seq == last:
+                    continue
+                if last:
+                    client.skipped += seq - last - 1
+                last = seq
+                head = b"--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % (
+                    self.boundary, len(data))
+                handler.wfile.write(head)
+                handler.wfile.write(data)
+                handler.wfile.write(b"\r\n")
+                sent = len(head) + len(data) + 2
+                with self._cond:
+                    client.frames += 1
+                    client.bytes += sent
+                    client.seq, client.frame_time = seq, timestamp
+                    client.delivery = time.monotonic() - timestamp
+                    self.egress += sent
+        except OSError:
+            pass  # Зритель отключился
+        finally:
+            with self._cond:
+                self.clients.pop(id(client), None)
+
+
+def camera_backends():
+    """Подходящие для системы бэкенды захвата OpenCV по порядку предпочтения"""
+    if sys.platform.startswith("win"):
+        backends = [cv2.CAP_DSHOW, cv2.CAP_MSMF]
+    elif sys.platform.startswith("linux"):
+        backends = [cv2.CAP_V4L2]
+    elif sys.platform == "darwin":
+        backends = [cv2.CAP_AVFOUNDATION]
+    else:
+        backends = []
+    return backends + [cv2.CAP_ANY]
+
+
+def open_camera(index=0, size=(640, 480), fps=30):
+    """Открывает камеру и сразу запрашивает MJPG, разрешение и частоту.
+
+    MJPG задаётся до размера: иначе многие камеры (V4L2, DirectShow) отдают
+    несжатый YUYV, который на высоких разрешениях упирается в полосу USB.
+    Возвращает cv2.VideoCapture или None.
+    """
+    for backend in camera_backends():
+        cap = cv2.VideoCapture(index, backend)
+        if not cap.isOpened():
+            cap.release()
+            continue
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+        cap.set(cv2.CAP_PROP_FPS, fps)
+        return cap
+    return None
+
+
+def camera_info(cap):
+    """'1280x720 MJPG 30 FPS (V4L2)' - что камера выдаёт на самом деле"""
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    codec = "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip("\0") or "?"
+    return (f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))} "
+            f"{codec} {cap.get(cv2.CAP_PROP_FPS):.0f} FPS ({cap.getBackendName()})")
+
 
 class VideoCameraApp:
-    def __init__(self, window):
+    def __init__(self, window, stats_log=None, capture_size=(640, 480), remap_workers=None,
+                 map_cache=None, presets_file=None, stream_address=("127.0.0.1", 8080)):
         self.window = window
+        # Адрес HTTP-трансляции MJPEG; "0.0.0.0" открывает её для локальной сети
+        self.stream_address = stream_address
+        self.stream_server = None
+        # Таблицы remap на диске (MapDiskCache): пресеты открываются без пересчёта
+        self.map_cache = map_cache
+        self.presets_file = presets_file or os.path.join(default_cache_dir(), "presets.json")
+        self.presets = load_presets(self.presets_file)
+        # Запрашиваемое разрешение камеры; фактическое берётся из cap после открытия
+        self.capture_size = capture_size
+        # Журнал замеров этапов (CSV или JSON Lines), дописывается раз в stats_log_interval секунд
+        self.stats_log = stats_log
+        self.stats_log_interval = 5.0
         self.language = "ru"
         self.translations = {
             "ru": {
@@ -35,7 +1862,28 @@ class VideoCameraApp:
                 "photo_saved": "Фото сохранено как:",
                 "change_lang": "EN",
                 "folder": "Папка:",
-                "not_selected": "не выбрана"
+                "not_selected": "не выбрана",
+                "queued": "в очереди",
+                "written": "записано",
+                "dropped": "пропущено",
+                "video_error": "Не удалось инициализировать запись видео",
+                "mux": "A/V в одном файле",
+                "overlay": "Статистика",
+                "grid": "⊞ Сетка эффектов",
+                "replay": "Буфер повтора",
+                "save_replay": "⏪ Сохранить повтор",
+                "replay_empty": "Буфер повтора пуст",
+                "photo": "Фото:",
+                "quality": "Качество:",
+                "burst": "Серия",
+                "photo_error": "Не удалось сохранить фото",
+                "presets": "Пресеты:",
+                "save_preset": "★ В пресеты",
+                "opening_camera": "Открытие камеры...",
+                "stream": "Трансляция",
+                "viewers": "зрителей",
+                "lag": "задержка",
+                "stream_error": "Не удалось запустить трансляцию"
             },
             "en": {
                 "title": "Video Camera with Effects",
@@ -56,47 +1904,134 @@ class VideoCameraApp:
                 "photo_saved": "Photo saved as:",
                 "change_lang": "RU",
                 "folder": "Folder:",
-                "not_selected": "not selected"
+                "not_selected": "not selected",
+                "queued": "queued",
+                "written": "written",
+                "dropped": "dropped",
+                "video_error": "Could not initialize video recording",
+                "mux": "A/V in one file",
+                "overlay": "Stats",
+                "grid": "⊞ Effect grid",
+                "replay": "Replay buffer",
+                "save_replay": "⏪ Save replay",
+                "replay_empty": "Replay buffer is empty",
+                "photo": "Photo:",
+                "quality": "Quality:",
+                "burst": "Burst",
+                "photo_error": "Could not save photo",
+                "presets": "Presets:",
+                "save_preset": "★ Save preset",
+                "opening_camera": "Opening camera...",
+                "stream": "Stream",
+                "viewers": "viewers",
+                "lag": "lag",
+                "stream_error": "Could not start stream"
             }
         }
         
+        # Время запуска (с от начала импорта модуля): окно, камера, первый кадр
+        self.startup = {"imports": time.perf_counter() - _IMPORT_START}
+        self.remap_workers = remap_workers
         self.setup_camera()
         self.create_widgets()
+        self.window.update_idletasks()
+        self.startup["window"] = time.perf_counter() - _IMPORT_START
+        # Камера открывается в фоне: окно уже показано и отвечает
+        self.status_var.set(self._tr("opening_camera"))
+        self._camera_result = None  # (cap,) от потока открытия, забирает update_frame
+        threading.Thread(target=self._open_camera, daemon=True).start()
         self.update_frame()
     
+    def _open_camera(self):
+        """Поток открытия камеры; результат передаётся в поток Tk через update_frame"""
+        try:
+            cap = open_camera(0, self.capture_size, self.default_record_fps)
+        except cv2.error as e:
+            print(f"Ошибка открытия камеры: {e}")
+            cap = None
+        self._camera_result = (cap,)
+
+    def _camera_opened(self, cap):
+        if cap is None:
+            self.status_var.set(self._tr("no_camera"))
+            return
+        self.cap = cap
+        self.startup["camera"] = time.perf_counter() - _IMPORT_START
+        # От 720p remap кадра делится на полосы по всем ядрам
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        workers = self.remap_workers
+        if workers is None:
+            workers = os.cpu_count() if width * height >= 1280 * 720 else 1
+        self.engine.set_workers(workers)
+
+        # Конвейер кадров запускается только с открытой камерой
+        self.pipeline = FramePipeline(
+            cap.read, self.process_frame,
+            workers=2, queue_size=2, drop_policy="latest", stats=self.stats)
+        self.pipeline.start()
+        self.status_var.set(f"{self._tr('ready')}  |  {camera_info(cap)}")
+
     def setup_camera(self):
-        self.cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-        if not self.cap.isOpened():
-            messagebox.showerror("Error", self._tr("no_camera"))
-            exit()
-            
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        self.cap.set(cv2.CAP_PROP_FPS, 30)
-        
+        self.cap = None  # Открывается в фоне (_open_camera)
+        self.pipeline = None
+
         # Video settings
         self.is_recording = False
-        self.video_writer = None
-        self.audio_recording = None
-        self.audio_frames = []
+        self.video_encoder = None
+        self.default_record_fps = 30  # Если частоту захвата ещё не удалось измерить
+        self.muxer = None  # FFmpegWriter в режиме "видео и звук в одном файле"
+        self.audio_recorder = None
         self.fps = 24
         self.save_path = ""
         self.frame_count = 0
         self.last_frame_time = 0
         
         # Math functions
-        self.math_funcs = {
-            'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
-            'arcsin': np.arcsin, 'arccos': np.arccos, 'arctan': np.arctan,
-            'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh,
-            'pi': np.pi, 'e': np.exp(1), 'exp': np.exp, 'log': np.log, 'sqrt': np.sqrt
-        }
+        self.math_funcs = MATH_FUNCS
         
         self.current_frame = None
+        self.current_time = 0.0
+        self.start_time = time.monotonic()  # Начало отсчёта t в формулах
         self.distorted_frame = None
         self.formula = "50*sinh(x)"
         self.imgtk = None
         self.last_formula_error = False
+
+        # Движок эффекта: таблицы remap пересобираются только при смене формулы или разрешения
+        # Число потоков remap задаётся, когда известно разрешение камеры
+        self.engine = DistortionEngine(compile_chain(self.formula, self.math_funcs),
+                                       disk_cache=self.map_cache)
+
+        # Конвейер: поток захвата -> рабочие потоки обработки -> отображение в Tk
+        self.display_size = None  # Размер области показа, обновляется из потока Tk
+        self.display_interval = 10  # мс между проверками готового кадра
+        self._shown_seq = 0
+        self._last_status_update = 0
+        self._last_stats_export = time.monotonic()
+        self.stats = StageStats()
+        self.show_overlay = False  # Флаг читается рабочими потоками, поэтому не tk.BooleanVar
+
+        # Сетка предпросмотра нескольких формул (щелчок по плитке выбирает формулу)
+        self.grid_mode = False
+        self.grid_tiles = 9
+        self.preview_grid = None
+
+        # Буфер повтора: последние replay_seconds секунд эффекта в JPEG (не больше replay_max_bytes)
+        self.replay_seconds = 30
+        self.replay_max_bytes = 256 * 1024 * 1024
+        self.replay = None
+        self.replay_audio = None
+
+        # Фото кодируются в фоне; серия - burst_count подряд идущих кадров полного размера
+        self.photo_saver = PhotoSaver()
+
+        # Выходные кадры полноразмерного эффекта (запись, повтор, трансляция)
+        self.frame_pool = FramePool()
+        self.burst_count = 10
+        self._burst_left = 0
+        self._burst_name = ""
+        self._burst_lock = threading.Lock()
     
     def _tr(self, key):
         return self.translations[self.language].get(key, key)
@@ -110,10 +2045,21 @@ class VideoCameraApp:
         self.record_btn.config(text=self._tr("stop_rec" if self.is_recording else "start_rec"))
         self.lang_btn.config(text=self._tr("change_lang"))
         self.take_photo_btn.config(text=self._tr("take_photo"))
+        self.grid_btn.config(text=self._tr("grid"))
         self.select_folder_btn.config(text=self._tr("select_folder"))
         self.open_folder_btn.config(text=self._tr("open_folder"))
         self.apply_btn.config(text=self._tr("apply"))
         self.clear_btn.config(text=self._tr("clear"))
+        self.mux_check.config(text=self._tr("mux"))
+        self.overlay_check.config(text=self._tr("overlay"))
+        self.replay_check.config(text=f"{self._tr('replay')} ({self.replay_seconds} s)")
+        self.save_replay_btn.config(text=self._tr("save_replay"))
+        self.stream_check.config(text=f"{self._tr('stream')} :{self.stream_address[1]}")
+        self.photo_label.config(text=self._tr("photo"))
+        self.quality_label.config(text=self._tr("quality"))
+        self.burst_btn.config(text=f"{self._tr('burst')} ×{self.burst_count}")
+        self.presets_label.config(text=self._tr("presets"))
+        self.save_preset_btn.config(text=self._tr("save_preset"))
         self.formula_label.config(text=self._tr("formula"))
         self.functions_label.config(text=self._tr("functions"))
     
@@ -152,6 +2098,9 @@ class VideoCameraApp:
         # Photo controls
         self.take_photo_btn = tk.Button(top_frame, text=self._tr("take_photo"), command=self.take_photo)
         self.take_photo_btn.pack(side=tk.LEFT, padx=5)
+
+        self.grid_btn = tk.Button(top_frame, text=self._tr("grid"), command=self.toggle_grid)
+        self.grid_btn.pack(side=tk.LEFT, padx=5)
         
         self.select_folder_btn = tk.Button(top_frame, text=self._tr("select_folder"), command=self.select_folder)
         self.select_folder_btn.pack(side=tk.LEFT, padx=5)
@@ -162,6 +2111,33 @@ class VideoCameraApp:
         # Добавляем новую кнопку в панель управления
         self.open_folder_btn = tk.Button(top_frame, text=self._tr("open_folder"), command=self.open_save_folder)
         self.open_folder_btn.pack(side=tk.LEFT, padx=5)
+
+        # Режим записи видео и звука в один файл (нужен установленный ffmpeg)
+        self.mux_var = tk.BooleanVar(value=find_ffmpeg() is not None)
+        self.mux_check = tk.Checkbutton(top_frame, text=self._tr("mux"), variable=self.mux_var,
+                                        state=tk.NORMAL if find_ffmpeg() else tk.DISABLED)
+        self.mux_check.pack(side=tk.LEFT, padx=5)
+
+        # FPS и задержки этапов поверх изображения
+        self.overlay_var = tk.BooleanVar(value=self.show_overlay)
+        self.overlay_check = tk.Checkbutton(top_frame, text=self._tr("overlay"), variable=self.overlay_var,
+                                            command=self._toggle_overlay)
+        self.overlay_check.pack(side=tk.LEFT, padx=5)
+
+        # Постоянная запись последних секунд для сохранения задним числом
+        self.replay_var = tk.BooleanVar(value=False)
+        self.replay_check = tk.Checkbutton(top_frame, text=f"{self._tr('replay')} ({self.replay_seconds} s)",
+                                           variable=self.replay_var, command=self.toggle_replay)
+        self.replay_check.pack(side=tk.LEFT, padx=5)
+        self.save_replay_btn = tk.Button(top_frame, text=self._tr("save_replay"), command=self.save_replay,
+                                         state=tk.DISABLED)
+        self.save_replay_btn.pack(side=tk.LEFT, padx=5)
+
+        # MJPEG-трансляция эффекта для других экранов
+        self.stream_var = tk.BooleanVar(value=False)
+        self.stream_check = tk.Checkbutton(top_frame, text=f"{self._tr('stream')} :{self.stream_address[1]}",
+                                           variable=self.stream_var, command=self.toggle_stream)
+        self.stream_check.pack(side=tk.LEFT, padx=5)
         
         # Main work area
         work_frame = tk.Frame(main_frame)
@@ -186,7 +2162,12 @@ class VideoCameraApp:
             "sqrt(x) - квадратный корень",
             "x**2 - квадрат числа",
             "a*b - умножение",
-            "a/b - деление"
+            "a/b - деление",
+            "y - вертикальная координата",
+            "r, theta - полярные координаты",
+            "dx, dy - смещение по x и по y",
+            "t - время в секундах (анимация)",
+            "a; b - цепочка эффектов"
         ]
         
         for func in func_list:
@@ -212,9 +2193,39 @@ class VideoCameraApp:
         
         self.clear_btn = tk.Button(formula_frame, text=self._tr("clear"), command=self.clear_formula)
         self.clear_btn.pack(side=tk.LEFT, padx=5)
+
+        # Photo settings: формат, качество и серия снимков
+        photo_frame = tk.Frame(camera_frame)
+        photo_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+
+        self.photo_label = tk.Label(photo_frame, text=self._tr("photo"))
+        self.photo_label.pack(side=tk.LEFT)
+        self.photo_format = tk.StringVar(value="JPEG")
+        ttk.Combobox(photo_frame, textvariable=self.photo_format, values=list(PHOTO_FORMATS),
+                     state="readonly", width=6).pack(side=tk.LEFT, padx=5)
+
+        self.quality_label = tk.Label(photo_frame, text=self._tr("quality"))
+        self.quality_label.pack(side=tk.LEFT)
+        self.photo_quality = tk.IntVar(value=95)
+        tk.Spinbox(photo_frame, from_=10, to=100, increment=5, textvariable=self.photo_quality,
+                   width=4).pack(side=tk.LEFT, padx=5)
+
+        self.burst_btn = tk.Button(photo_frame, text=f"{self._tr('burst')} ×{self.burst_count}",
+                                   command=self.take_burst)
+        self.burst_btn.pack(side=tk.LEFT, padx=5)
+
+        # Библиотека пресетов: выбор сразу применяет формулу
+        self.save_preset_btn = tk.Button(photo_frame, text=self._tr("save_preset"), command=self.save_preset)
+        self.save_preset_btn.pack(side=tk.RIGHT, padx=5)
+        self.preset_box = ttk.Combobox(photo_frame, values=self.presets, state="readonly", width=30)
+        self.preset_box.bind("<<ComboboxSelected>>", self.apply_preset)
+        self.preset_box.pack(side=tk.RIGHT, padx=5)
+        self.presets_label = tk.Label(photo_frame, text=self._tr("presets"))
+        self.presets_label.pack(side=tk.RIGHT)
         
         # Camera display
         self.camera_label = tk.Label(camera_frame, bg='black')
+        self.camera_label.bind("<Button-1>", self.on_preview_click)
         self.camera_label.pack(fill=tk.BOTH, expand=True)
         
         # Status bar
@@ -224,69 +2235,57 @@ class VideoCameraApp:
     
     def apply_formula(self):
         self.formula = self.entry.get().replace("^", "**").replace(" ", "")
-    
-        # Проверка на использование только допустимой переменной x
-        variables = set()
-        try:
-            # Анализируем формулу на предмет переменных
-            from ast import parse, walk, Name
-            tree = parse(self.formula)
-            variables = {node.id for node in walk(tree) if isinstance(node, Name)}
-            variables.discard('x')  # Разрешаем только x
-            variables.difference_update(self.math_funcs.keys())  # Игнорируем функции
-        
-            if variables:
-                raise ValueError(f"Используйте только 'x' как переменную или проверьте правильность написания функции из доступных. Найдены: {', '.join(variables)}")
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e))
-            return False
+        self.engine.set_formula(None)
 
-        # Проверка на доступные функции
         try:
-            # Извлекаем все имена из формулы
-            import re
-            words = re.findall(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b', self.formula)
-            invalid_funcs = [w for w in words if w not in self.math_funcs and w != 'x']
-        
-            if invalid_funcs:
-                available = ", ".join(sorted(self.math_funcs.keys()))
-                raise ValueError(f"Неизвестные функции: {', '.join(invalid_funcs)}\nДоступные: {available}")
+            # Разбираем формулы один раз: AST проверяется по белому списку и компилируется
+            chain = compile_chain(self.formula, self.math_funcs)
+            if not chain:
+                raise FormulaError("Неправильный синтаксис формулы")
 
-            # Проверяем синтаксис и вычисляемость
+            # Проверяем вычисляемость каждого эффекта цепочки
             test_x = np.linspace(0.1, 10, 10)  # Начинаем с 0.1 для log
-            with np.errstate(all='ignore'):
-                result = eval(self.formula, {'x': test_x, **self.math_funcs})
-                if np.any(np.isnan(result)) or np.any(np.isinf(result)):
-                    raise ValueError("Формула дает недопустимые значения")
-        
-            self.last_formula_error = False
-            return True
-        
-        except SyntaxError:
-            messagebox.showerror("Ошибка", "Неправильный синтаксис формулы")
-            return False
+            coords = dict(x=test_x, y=test_x, r=np.hypot(test_x, test_x), theta=np.arctan2(test_x, test_x))
+            for i, compiled in enumerate(chain, 1):
+                result = compiled(t=test_x, **coords, **compiled.invariants(**coords))
+                for component in (result if compiled.is_vector else (result,)):
+                    if np.any(np.isnan(component)) or np.any(np.isinf(component)):
+                        prefix = f"Эффект {i}: " if len(chain) > 1 else ""
+                        raise FormulaError(prefix + "Формула дает недопустимые значения")
         except Exception as e:
-            error_msg = str(e)
-            if "name" in error_msg and "is not defined" in error_msg:
-                # Извлекаем имя из сообщения об ошибке
-                missing = error_msg.split("'")[1]
-                if missing in ['sin1', 'log2']:  # Примеры неправильных функций
-                    error_msg = f"Функция '{missing}' не существует. Проверьте написание."
-                else:
-                    error_msg = f"Неизвестный идентификатор: '{missing}'"
-        
-            messagebox.showerror("Ошибка", error_msg)
+            messagebox.showerror("Ошибка", str(e))
             self.last_formula_error = True
             self.entry.delete(0, tk.END)
             self.entry.insert(0, self.formula)
             return False
 
+        self.engine.set_formula(chain)
+        self.last_formula_error = False
+        return True
     
-    
+    def apply_preset(self, event=None):
+        formula = self.preset_box.get()
+        if formula:
+            self.entry.delete(0, tk.END)
+            self.entry.insert(0, formula)
+            self.apply_formula()
+
+    def save_preset(self):
+        """Добавляет текущую (применённую) формулу в пресеты"""
+        if not self.formula or self.last_formula_error or self.formula in self.presets:
+            return
+        self.presets.append(self.formula)
+        self.preset_box.config(values=self.presets)
+        try:
+            save_presets(self.presets_file, self.presets)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить пресеты: {e}")
+
     def clear_formula(self):
         self.entry.delete(0, tk.END)
         self.formula = ""
         self.last_formula_error = False
+        self.engine.set_formula(None)
     
     def toggle_recording(self):
         if not self.is_recording:
@@ -298,6 +2297,9 @@ class VideoCameraApp:
         if not self.save_path:
             messagebox.showwarning("Warning", self._tr("no_folder"))
             return
+        if self.pipeline is None:
+            messagebox.showwarning("Warning", self._tr("no_camera"))
+            return
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.video_filename = os.path.join(self.save_path, f"video_{timestamp}.avi")
@@ -306,24 +2308,53 @@ class VideoCameraApp:
         width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         
-        # Используем кодек MJPG и формат AVI для совместимости
-        self.video_writer = cv2.VideoWriter(
-            self.video_filename,
-            cv2.VideoWriter_fourcc('M','J','P','G'),
-            30,  # Фиксированные 30 FPS
-            (width, height))
+        # Частота файла - измеренная частота захвата, а не фиксированные 30 FPS
+        fps = self.pipeline.capture_fps() or self.default_record_fps
+
+        # Общие монотонные часы для кадров и звука
+        start_time = time.monotonic()
+        muxed = self.mux_var.get() and find_ffmpeg() is not None
+
+        if muxed:
+            # Звук запускаем первым: если микрофона нет, ffmpeg пишет только видео
+            audio_sink = SocketAudioSink()
+            try:
+                self.audio_recorder = AudioRecorder(audio_sink, buffer_seconds=5.0, start_time=start_time)
+                self.audio_recorder.start()
+            except Exception as e:
+                print(f"Ошибка записи аудио: {e}")
+                self.audio_recorder = None
+                audio_sink = None
+            writer = FFmpegWriter(self.video_filename, (width, height), fps, audio_sink)
+            self.muxer = writer
+        else:
+            # Используем кодек MJPG и формат AVI для совместимости
+            writer = cv2.VideoWriter(self.video_filename, cv2.VideoWriter_fourcc(*'MJPG'),
+                                     fps, (width, height))
+
+        encoder = VideoEncoder(writer, fps, start_time=start_time, stats=self.stats,
+                               reorder=self.pipeline.workers)
             
-        if not self.video_writer.isOpened():
-            messagebox.showerror("Error", "Не удалось инициализировать запись видео")
+        if not encoder.isOpened():
+            if muxed and audio_sink is not None:
+                audio_sink.disable()  # ffmpeg не подключится - не ждём его
+            encoder.stop()
+            self._stop_audio()
+            self.muxer = None
+            messagebox.showerror("Error", self._tr("video_error"))
             return
+        encoder.start()
+        self.video_encoder = encoder
         
-        # Audio settings
-        self.audio_frames = []
-        self.audio_recording = True
-        self.audio_thread = threading.Thread(
-            target=self.record_audio,
-            daemon=True)
-        self.audio_thread.start()
+        if not muxed:
+            # Audio settings: звук пишется на диск по мере записи
+            audio_filename = os.path.join(self.save_path, f"audio_{timestamp}.wav")
+            try:
+                self.audio_recorder = AudioRecorder(open_wav(audio_filename), start_time=start_time)
+                self.audio_recorder.start()
+            except Exception as e:
+                print(f"Ошибка записи аудио: {e}")
+                self.audio_recorder = None
         
         self.is_recording = True
         self.frame_count = 0
@@ -334,46 +2365,125 @@ class VideoCameraApp:
     
     def stop_recording(self):
         self.is_recording = False
-        self.audio_recording = False
         
-        if self.video_writer:
-            self.video_writer.release()
-            self.video_writer = None
+        encoder, self.video_encoder = self.video_encoder, None
+        if encoder:
+            encoder.stop()
             
-        if len(self.audio_frames) > 0:
-            self.save_audio_video()  # Сохраняем видео с аудио
+        self._stop_audio()
+
+        muxer, self.muxer = self.muxer, None
+        if muxer:
+            muxer.finish()
             
         self.record_btn.config(text=self._tr("start_rec"), fg="black")
         self.status_var.set(f"{self._tr('saved')} {self.video_filename}")
         self.update_ui_text()
     
-    def record_audio(self):
-        """Записывает аудио в отдельном потоке"""
-        with sd.InputStream(
-            samplerate=44100,
-            channels=2,
-            dtype='int16',  # Используем int16 для совместимости с WAV
-            blocksize=1024,
-            device=None) as stream:
-            
-            while self.audio_recording:
-                data, overflowed = stream.read(1024)
-                if overflowed:
-                    print("Audio overflow!")
-                self.audio_frames.append(data)
-    
-    def save_audio_video(self):
-    #Сохраняет видео с аудио в AVI файле
+    def toggle_replay(self):
+        if self.replay_var.get():
+            replay = ReplayBuffer(self.replay_seconds, self.replay_max_bytes, stats=self.stats)
+            replay.start()
+            try:
+                self.replay_audio = AudioReplay(self.replay_seconds + 1)
+                self.replay_audio.start()
+            except Exception as e:
+                print(f"Ошибка записи аудио: {e}")
+                self.replay_audio = None
+            self.replay = replay
+            self.save_replay_btn.config(state=tk.NORMAL)
+        else:
+            self._stop_replay()
+            self.save_replay_btn.config(state=tk.DISABLED)
+
+    def toggle_stream(self):
+        if self.stream_var.get():
+            try:
+                server = MJPEGServer(*self.stream_address, stats=self.stats)
+            except OSError as e:
+                self.stream_var.set(False)
+                messagebox.showerror("Error", f"{self._tr('stream_error')}: {e}")
+                return
+            server.start()
+            self.stream_server = server
+            self.status_var.set(server.stats_text(self._tr))
+        else:
+            self._stop_stream()
+            self.status_var.set(self._tr("ready"))
+
+    def _stop_stream(self):
+        server, self.stream_server = self.stream_server, None
+        if server:
+            server.stop()
+
+    def _stop_replay(self):
+        replay, self.replay = self.replay, None
+        if replay:
+            replay.stop()
+        audio, self.replay_audio = self.replay_audio, None
+        if audio:
+            audio.stop()
+
+    def save_replay(self):
+        """Сохраняет содержимое буфера повтора; файлы пишутся в фоне, предпросмотр не ждёт"""
+        if not self.save_path:
+            messagebox.showwarning("Warning", self._tr("no_folder"))
+            return
+        replay = self.replay
+        # Здесь только список номеров кадров; сами кадры копирует фоновый поток
+        frames = replay.snapshot() if replay else []
+        if len(frames) < 2:
+            self.status_var.set(self._tr("replay_empty"))
+            return
+        # Звук вырезаем сразу, пока его не затёрли новые сэмплы
+        start_time, last_time = frames[0][1], frames[-1][1]
+        end_time = last_time + (last_time - start_time) / (len(frames) - 1)
+        audio = self.replay_audio.clip(start_time, end_time) if self.replay_audio else None
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        video_filename = os.path.join(self.save_path, f"replay_{timestamp}.avi")
+        audio_filename = os.path.join(self.save_path, f"replay_{timestamp}.wav")
+        threading.Thread(target=self._write_replay, daemon=True,
+                         args=(replay, frames, audio, video_filename, audio_filename)).start()
+
+    def _write_replay(self, replay, snapshot, audio, video_filename, audio_filename):
         try:
-            if len(self.audio_frames) > 0:
-                audio_filename = os.path.join(self.save_path, f"audio_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav")
-                with wave.open(audio_filename, 'wb') as wf:
-                    wf.setnchannels(2)
-                    wf.setsampwidth(2)
-                    wf.setframerate(44100)
-                    wf.writeframes(np.concatenate(self.audio_frames).tobytes())
+            # Частота файла - средняя частота кадров в буфере, пропуски заполняет VideoEncoder
+            start_time = snapshot[0][1]
+            fps = (len(snapshot) - 1) / (snapshot[-1][1] - start_time)
+            encoder = None
+            for ts, jpeg in replay.frames(snapshot):
+                frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                if encoder is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(video_filename, cv2.VideoWriter_fourcc(*'MJPG'), fps,
+                                             (width, height))
+                    encoder = VideoEncoder(writer, fps, queue_size=8, start_time=start_time)
+                    if not encoder.isOpened():
+                        encoder.stop()
+                        raise RuntimeError(self._tr("video_error"))
+                    encoder.start()
+                encoder.submit(frame, ts, block=True)
+            if encoder is None:
+                raise RuntimeError(self._tr("replay_empty"))
+            encoder.stop()
+            if audio is not None:
+                wf = open_wav(audio_filename)
+                wf.writeframes(audio.tobytes())
+                wf.close()
+            message = f"{self._tr('saved')} {video_filename}"
         except Exception as e:
-            print(f"Ошибка сохранения аудио: {e}")
+            print(f"Ошибка сохранения повтора: {e}")
+            message = str(e)
+        self.window.after(0, self.status_var.set, message)
+
+    def _stop_audio(self):
+        recorder, self.audio_recorder = self.audio_recorder, None
+        if recorder:
+            try:
+                recorder.stop()
+            except Exception as e:
+                print(f"Ошибка сохранения аудио: {e}")
     
     def select_folder(self):
         folder = filedialog.askdirectory()
@@ -414,7 +2524,7 @@ class VideoCameraApp:
                 f"{self._tr('folder_open_error')}: {str(e)}"
             )
     def take_photo(self):
-        if self.distorted_frame is None:
+        if self.current_frame is None:
             messagebox.showwarning("Warning", "Нет данных с камеры")
             return
             
@@ -422,93 +2532,438 @@ class VideoCameraApp:
             messagebox.showwarning("Warning", self._tr("no_folder"))
             return
             
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(self.save_path, f"photo_{timestamp}.jpg")
-        
+        fmt, quality = self._photo_settings()
+        filename = self.photo_saver.unique_name(self.save_path, "photo", fmt)
+        # Предпросмотр считается в размере окна - полный кадр эффекта строится в пуле
+        t = self.current_time
+        self.photo_saver.save(self.current_frame, filename, fmt, quality,
+                              process=lambda frame: self.distort_image(frame, t),
+                              callback=self._photo_saved)
+
+    def take_burst(self):
+        """Серия: следующие burst_count кадров конвейера сохраняются в полном размере"""
+        if not self.save_path:
+            messagebox.showwarning("Warning", self._tr("no_folder"))
+            return
+        with self._burst_lock:
+            self._burst_name = "burst_" + datetime.now().strftime("%Y%m%d_%H%M%S")
+            self._burst_format = self._photo_settings()
+            self._burst_left = self.burst_count
+
+    def _photo_settings(self):
         try:
-            cv2.imwrite(filename, self.distorted_frame)
-            messagebox.showinfo("Успех", f"{self._tr('photo_saved')}\n{filename}")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось сохранить фото: {e}")
+            quality = min(100, max(10, int(self.photo_quality.get())))
+        except (tk.TclError, ValueError):
+            quality = 95
+        return self.photo_format.get(), quality
+
+    def _burst_frame(self, frame, t, seq):
+        """Вызывается из рабочего потока: забирает кадр в серию, если она идёт"""
+        with self._burst_lock:
+            if self._burst_left <= 0:
+                return
+            self._burst_left -= 1
+            name, (fmt, quality) = self._burst_name, self._burst_format
+        # Номер кадра конвейера: имена уникальны и идут по порядку захвата
+        filename = os.path.join(self.save_path, f"{name}_{seq:06d}{PHOTO_FORMATS[fmt][0]}")
+        self.photo_saver.save(frame, filename, fmt, quality,
+                              process=lambda frame: self.distort_image(frame, t),
+                              callback=self._photo_saved)
+
+    def _photo_saved(self, filename, error):
+        """Итог сохранения из потока пула: сообщение в строке состояния вместо модального окна"""
+        if error is not None:
+            print(f"Ошибка сохранения фото: {error}")
+            message = f"{self._tr('photo_error')}: {error}"
+        else:
+            message = f"{self._tr('photo_saved')} {filename}"
+        self.window.after(0, self.status_var.set, message)
     
-    def distort_image(self, frame):
-        if not self.formula:
+    def distort_image(self, frame, t=0.0, out=None):
+        try:
+            return self.engine.distort(frame, t, out)
+        except Exception as e:
+            print(f"Ошибка в формуле: {e}")
             return frame
+
+    def preview_image(self, frame, t=0.0):
         try:
-            height, width = frame.shape[:2]
-            x = np.linspace(-10, 10, width)
-        
-        # Вычисляем формулу с обработкой ошибок
-            with np.errstate(all='ignore'):  # Игнорируем предупреждения
-                y = eval(self.formula, {'x': x, **self.math_funcs})
-                y = np.nan_to_num(y)  # Заменяем NaN на 0
-            
-            y_min, y_max = np.min(y), np.max(y)
-            if y_max - y_min > 0:
-                y = (y - y_min) / (y_max - y_min) * height
-            else:
-                y = np.zeros_like(y)
-        
-            xx, yy = np.meshgrid(np.arange(width), np.arange(height))
-            map_y = yy + y - height//2
-        
-            return cv2.remap(frame, 
-                        xx.astype(np.float32), 
-                        map_y.astype(np.float32),
-                        interpolation=cv2.INTER_LINEAR,
-                        borderMode=cv2.BORDER_REPLICATE)
+            return self.engine.preview(frame, self.display_size, t)
         except Exception as e:
             print(f"Ошибка в формуле: {e}")
-            return frame  
+            h, w = frame.shape[:2]
+            return cv2.resize(frame, fit_size(w, h, *self.display_size))
     
     
+    def process_frame(self, frame, timestamp, seq):
+        """Обрабатывает кадр в рабочем потоке конвейера: эффект, запись, подготовка к показу"""
+        self.current_frame = frame
+        # Время для анимированных формул - по метке захвата кадра
+        self.current_time = t = timestamp - self.start_time
+        if self._burst_left:
+            self._burst_frame(frame, t, seq)
+
+        # Полноразмерный эффект нужен только для записи и буфера повтора
+        encoder = self.video_encoder if self.is_recording else None
+        replay = self.replay
+        server = self.stream_server
+        stream = server is not None and server.clients
+        if encoder or replay or stream:
+            with self.stats.measure("distort"):
+                distorted = self.distort_image(frame, t, self.frame_pool.get(frame.shape, frame.dtype))
+            self.distorted_frame = distorted
+            # Кодирование идёт в отдельных потоках; кадр несёт метку времени захвата
+            if encoder:
+                encoder.submit(distorted, timestamp, seq=seq)
+            if replay:
+                replay.submit(distorted, timestamp)
+            if stream:
+                server.submit(distorted, timestamp)
+
+        # Предпросмотр: эффект и масштаб одним remap прямо в размер области показа
+        if self.display_size is None:
+            return None
+        grid = self.preview_grid if self.grid_mode else None
+        if grid is not None:
+            with self.stats.measure("grid"):
+                preview = grid.render(frame, self.display_size, t)
+        else:
+            with self.stats.measure("preview"):
+                preview = self.preview_image(frame, t)
+        with self.stats.measure("convert"):
+            image = bgr_to_pil(preview)
+        if self.show_overlay:
+            self._draw_stats_overlay(image)
+        return image
+
+    def toggle_grid(self):
+        """Включает сетку: текущая формула и формулы из GRID_FORMULAS на одном кадре"""
+        if self.grid_mode:
+            self.grid_mode = False
+            self.grid_btn.config(relief=tk.RAISED)
+            return
+        formulas = ([self.formula] if self.formula else []) + \
+            [f for f in GRID_FORMULAS if f != self.formula]
+        formulas = formulas[:self.grid_tiles]
+        if self.preview_grid is None:
+            self.preview_grid = PreviewGrid(formulas)
+        else:
+            self.preview_grid.set_formulas(formulas)
+        self.grid_mode = True
+        self.grid_btn.config(relief=tk.SUNKEN)
+
+    def on_preview_click(self, event):
+        """Щелчок по плитке сетки делает её формулу текущей"""
+        if not self.grid_mode or self.display_size is None:
+            return
+        formula = self.preview_grid.tile_at(self.display_size, event.x, event.y)
+        if formula is None:
+            return
+        self.entry.delete(0, tk.END)
+        self.entry.insert(0, formula)
+        if self.apply_formula():
+            self.toggle_grid()
+
+    def _toggle_overlay(self):
+        self.show_overlay = self.overlay_var.get()
+
+    def _draw_stats_overlay(self, image):
+        """Рисует FPS и перцентили этапов поверх кадра предпросмотра (в файл не попадает)"""
+        lines = self.stats.summary_lines()
+        draw = ImageDraw.Draw(image)
+        for i, line in enumerate(lines):
+            xy = (8, 6 + 14 * i)
+            draw.text((xy[0] + 1, xy[1] + 1), line, fill=(0, 0, 0))
+            draw.text(xy, line, fill=(255, 255, 0))
+
     def update_frame(self):
+        """Цикл Tk: только выводит самый свежий готовый кадр"""
         try:
-            ret, frame = self.cap.read()
-            if not ret:
-                raise RuntimeError("Не удалось получить кадр с камеры")
-            
-            self.current_frame = frame.copy()
-            self.distorted_frame = self.distort_image(frame)
+            if self._camera_result is not None:
+                (cap,), self._camera_result = self._camera_result, None
+                self._camera_opened(cap)
 
-            # Записываем кадры с правильным FPS
-            if self.is_recording and self.video_writer:
-                self.video_writer.write(self.distorted_frame)
-            
-            # Масштабируем для отображения
             label_width = self.camera_label.winfo_width()
             label_height = self.camera_label.winfo_height()
-            
             if label_width > 10 and label_height > 10:
-                h, w = self.distorted_frame.shape[:2]
-                ratio = min(label_width/w, label_height/h)
-                new_size = (int(w*ratio), int(h*ratio))
-                display_frame = cv2.resize(self.distorted_frame, new_size)
-                
-                display_frame = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(display_frame)
-                self.imgtk = ImageTk.PhotoImage(image=img)
-                self.camera_label.config(image=self.imgtk)
+                self.display_size = (label_width, label_height)
+
+            # Статистика записи в строке состояния (не чаще двух раз в секунду)
+            now = time.monotonic()
+            encoder = self.video_encoder
+            if self.is_recording and encoder and now - self._last_status_update > 0.5:
+                self._last_status_update = now
+                self.status_var.set(f"{self._tr('recording')} {self.video_filename}  |  "
+                                    f"{encoder.stats_text(self._tr)}")
+            elif self.stream_server and now - self._last_status_update > 0.5:
+                # Зрители трансляции, их задержка и отданный объём
+                self._last_status_update = now
+                self.status_var.set(self.stream_server.stats_text(self._tr))
+
+            latest = self.pipeline.latest() if self.pipeline else None
+            if latest is not None and latest[0] != self._shown_seq and latest[1] is not None:
+                self._shown_seq = latest[0]
+                with self.stats.measure("blit"):
+                    self.imgtk = ImageTk.PhotoImage(image=latest[1])
+                    self.camera_label.config(image=self.imgtk)
+                self.stats.tick("display")
+                if "first_frame" not in self.startup:
+                    self._report_startup()
+
+            # Периодическая выгрузка замеров в журнал
+            if self.stats_log and now - self._last_stats_export > self.stats_log_interval:
+                self._last_stats_export = now
+                try:
+                    self.stats.export(self.stats_log)
+                except OSError as e:
+                    print(f"Ошибка записи журнала замеров: {e}")
         except Exception as e:
             print(f"Ошибка в update_frame: {e}")
         finally:
-            self.window.after(30, self.update_frame)
+            self.window.after(self.display_interval, self.update_frame)
 
     
+    def _report_startup(self):
+        """Время до первого кадра - в журнал замеров (этап startup) и в консоль"""
+        self.startup["first_frame"] = elapsed = time.perf_counter() - _IMPORT_START
+        self.stats.record("startup", elapsed)
+        print("Запуск: " + ", ".join(f"{name} {seconds:.2f} с" for name, seconds in self.startup.items()))
+
     def run(self):
         self.window.mainloop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        self.engine.shutdown()
+        if self.preview_grid is not None:
+            self.preview_grid.shutdown()
         if self.is_recording:
             self.stop_recording()
-        self.cap.release()
+        self._stop_replay()
+        self._stop_stream()
+        self.photo_saver.shutdown()
+        if self.cap is not None:
+            self.cap.release()
 
-if __name__ == "__main__":
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+VIDEO_EXTENSIONS = {'.avi', '.mp4', '.mov', '.mkv', '.webm', '.m4v', '.wmv'}
+
+_batch_engine = None
+
+
+def _init_batch_worker(formula):
+    """Инициализация процесса пула: свой движок, OpenCV без внутренних потоков"""
+    global _batch_engine
+    cv2.setNumThreads(1)
+    _batch_engine = DistortionEngine(formula)
+
+
+def _batch_image(src, dst):
+    frame = cv2.imread(src)
+    if frame is None:
+        raise RuntimeError(f"Не удалось прочитать {src}")
+    if not cv2.imwrite(dst, _batch_engine.distort(frame, 0.0)):
+        raise RuntimeError(f"Не удалось записать {dst}")
+    return 1
+
+
+def _batch_video_chunk(src, dst, start, count):
+    """Обрабатывает кадры [start, start+count) видео в отдельный файл-часть"""
+    cap = cv2.VideoCapture(src)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    writer = cv2.VideoWriter(dst, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    done = 0
     try:
-        import sounddevice as sd
-    except ImportError:
-        print("Для работы с аудио установите:")
-        print("pip install sounddevice")
-        sys.exit(1)
-        
+        while done < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            # t - время кадра в исходном видео, поэтому части склеиваются без скачков
+            writer.write(_batch_engine.distort(frame, (start + done) / fps))
+            done += 1
+    finally:
+        writer.release()
+        cap.release()
+    return done
+
+
+def _join_video_parts(parts, dst, src, fps):
+    """Склеивает части в один файл: ffmpeg без перекодирования (со звуком исходника), иначе через OpenCV"""
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        list_file = dst + ".parts.txt"
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for part in parts:
+                f.write("file '{}'\n".format(os.path.abspath(part).replace("'", "'\\''")))
+        result = subprocess.run(
+            [ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+             "-f", "concat", "-safe", "0", "-i", list_file, "-i", src,
+             "-map", "0:v", "-map", "1:a?", "-c:v", "copy", "-c:a", "pcm_s16le", dst])
+        os.remove(list_file)
+        if result.returncode == 0:
+            return
+    writer = None
+    for part in parts:
+        cap = cv2.VideoCapture(part)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if writer is None:
+                h, w = frame.shape[:2]
+                writer = cv2.VideoWriter(dst, cv2.VideoWriter_fourcc(*'MJPG'), fps, (w, h))
+            writer.write(frame)
+        cap.release()
+    if writer is not None:
+        writer.release()
+
+
+def _collect_inputs(paths):
+    """Разворачивает каталоги в списки файлов: [(путь, относительное имя)]"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    full = os.path.join(root, name)
+                    files.append((full, os.path.relpath(full, path)))
+        elif os.path.isfile(path):
+            files.append((path, os.path.basename(path)))
+        else:
+            print(f"Пропущено (не найдено): {path}")
+    return [(f, rel) for f, rel in files
+            if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS]
+
+
+def run_batch(formula, inputs, output_dir, workers=None, chunk_frames=300):
+    """Пакетная обработка файлов без окна: изображения и видео на всех ядрах.
+
+    Видео режутся на части по chunk_frames кадров, каждая часть - отдельная
+    задача пула процессов. Возвращает (кадров, секунд).
+    """
+    compile_chain(formula)  # Ошибку в формуле показываем до запуска пула
+    files = _collect_inputs(inputs)
+    if not files:
+        print("Нет подходящих файлов")
+        return 0, 0.0
+
+    started = time.perf_counter()
+    tasks = {}
+    videos = {}  # dst -> (src, fps, [части])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                             initargs=(formula,)) as pool:
+        for src, rel in files:
+            dst = os.path.join(output_dir, rel)
+            os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+            if os.path.splitext(src)[1].lower() in IMAGE_EXTENSIONS:
+                tasks[pool.submit(_batch_image, src, dst)] = rel
+                continue
+            dst = os.path.splitext(dst)[0] + ".avi"
+            cap = cv2.VideoCapture(src)
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30
+            cap.release()
+            if total <= 0:
+                chunks = [(0, sys.maxsize)]  # Длина неизвестна - одна часть до конца файла
+            else:
+                chunks = [(start, min(chunk_frames, total - start))
+                          for start in range(0, total, chunk_frames)]
+            parts = [f"{dst}.part{i:04d}.avi" for i in range(len(chunks))]
+            videos[dst] = (src, fps, parts)
+            for (start, count), part in zip(chunks, parts):
+                tasks[pool.submit(_batch_video_chunk, src, part, start, count)] = \
+                    f"{rel} [{start}+{count if count != sys.maxsize else '...'}]"
+
+        frames = 0
+        for done, future in enumerate(as_completed(tasks), 1):
+            name = tasks[future]
+            try:
+                n = future.result()
+                frames += n
+                elapsed = time.perf_counter() - started
+                print(f"[{done}/{len(tasks)}] {name}: {n} кадр.  ({frames / elapsed:.1f} FPS)")
+            except Exception as e:
+                print(f"[{done}/{len(tasks)}] {name}: ошибка: {e}")
+
+    for dst, (src, fps, parts) in videos.items():
+        existing = [p for p in parts if os.path.exists(p)]
+        _join_video_parts(existing, dst, src, fps)
+        for part in existing:
+            os.remove(part)
+
+    elapsed = time.perf_counter() - started
+    print(f"Готово: {len(files)} файл(ов), {frames} кадров за {elapsed:.1f} с "
+          f"({frames / elapsed if elapsed else 0:.1f} FPS)")
+    return frames, elapsed
+
+
+def parse_size(text):
+    """'1920x1080' -> (1920, 1080) для argparse"""
+    try:
+        width, height = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается ШИРИНАxВЫСОТА, получено '{text}'")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"недопустимый размер '{text}'")
+    return width, height
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="ReDisCa - камера с эффектами. Без аргументов запускает окно; "
+                    "с --formula и входными файлами обрабатывает их без окна.")
+    parser.add_argument("inputs", nargs="*", help="файлы или каталоги с изображениями/видео")
+    parser.add_argument("-f", "--formula", help="формула эффекта, например '50*sinh(x)'")
+    parser.add_argument("-o", "--output", default="distorted", help="каталог для результатов")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument("--chunk-frames", type=int, default=300, help="кадров видео в одной задаче")
+    parser.add_argument("--stats-log", help="журнал замеров этапов в окне (.csv или .jsonl)")
+    parser.add_argument("--resolution", type=parse_size, default=(640, 480),
+                        help="разрешение камеры, например 1920x1080")
+    parser.add_argument("--remap-threads", type=int, default=None,
+                        help="потоков на remap одного кадра (по умолчанию - все ядра от 720p)")
+    parser.add_argument("--map-cache", default=os.path.join(default_cache_dir(), "maps"),
+                        help="каталог кэша таблиц remap")
+    parser.add_argument("--stream-host", default="127.0.0.1",
+                        help="адрес MJPEG-трансляции (0.0.0.0 - доступ из локальной сети)")
+    parser.add_argument("--stream-port", type=int, default=8080, help="порт MJPEG-трансляции")
+    parser.add_argument("--map-cache-mb", type=int, default=1024,
+                        help="предельный размер кэша таблиц в МБ (0 - без кэша на диске)")
+    args = parser.parse_args(argv)
+
+    if args.inputs or args.formula:
+        if not (args.inputs and args.formula):
+            parser.error("для пакетной обработки нужны --formula и входные файлы")
+        try:
+            run_batch(args.formula.replace("^", "**"), args.inputs, args.output,
+                      args.workers, args.chunk_frames)
+        except FormulaError as e:
+            print(f"Ошибка в формуле: {e}")
+            return 2
+        return 0
+
+    map_cache = None
+    if args.map_cache_mb > 0:
+        try:
+            map_cache = MapDiskCache(args.map_cache, args.map_cache_mb * 1024 * 1024)
+        except OSError as e:
+            print(f"Кэш таблиц отключён: {e}")
+
+    try:
+        _load_tk()
+    except ImportError as e:
+        print(f"Для окна программы нужен tkinter (например, пакет python3-tk): {e}")
+        return 1
     root = tk.Tk()
-    app = VideoCameraApp(root)
-    app.run()
\ No newline at end of file
+    app = VideoCameraApp(root, stats_log=args.stats_log, capture_size=args.resolution,
+                         remap_workers=args.remap_threads, map_cache=map_cache,
+                         stream_address=(args.stream_host, args.stream_port))
+    app.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""Замеры скорости горячих участков ReDisCa без камеры.
+
+Синтетические кадры 480p/720p/1080p/4K прогоняются через DistortionEngine:
+полноразмерный эффект (запись) и совмещённый с масштабом предпросмотр
+(как в VideoCameraApp.process_frame). Результат -
+JSON, чтобы сравнивать прогоны между коммитами:
+
+    python benchmark.py -o bench.json
+    python benchmark.py --resolutions 720p 1080p --formulas "50*sinh(x)" --repeat 50
+
+В отчёт входит время импорта ReDisCa в новом процессе (часть запуска окна).
+--scaling добавляет кривую масштабирования remap по полосам: время
+distort при 1..N потоках (внутренние потоки OpenCV отключены).
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from ReDisCa import DistortionEngine, bgr_to_pil
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+RESOLUTIONS = {
+    "480p": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4K": (3840, 2160),
+}
+
+# Формулы по умолчанию: стандартная, периодическая, с областями NaN (log/sqrt при x < 0)
+# двумерные (вертикальный сдвиг от y и радиальное смещение dx, dy), анимированные (t)
+# и цепочка эффектов
+FORMULAS = [
+    "50*sinh(x)",
+    "20*sin(x)",
+    "x**2",
+    "log(x)",
+    "sqrt(x)",
+    "10*log(x)*sqrt(x)",
+    "20*sin(y)",
+    "x*(r/10-1), y*(r/10-1)",
+    "50*sin(x + t)",
+    "2*sin(r - t)*cos(theta), 2*sin(r - t)*sin(theta)",
+    "50*sinh(x); x*(r/10-1), y*(r/10-1)",
+]
+
+# Область показа при окне 1000x700 по умолчанию
+DISPLAY_SIZE = (770, 560)
+
+
+def synthetic_frame(width, height, seed=0):
+    """Кадр с шумом и градиентом, чтобы интерполяция не работала по пустой картинке"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    frame[..., 0] = np.linspace(0, 255, width, dtype=np.uint8)
+    return frame
+
+
+def time_stage(func, repeat, warmup=2):
+    """Возвращает (мс на вызов: медиана, мин, пик памяти numpy в байтах)"""
+    for _ in range(warmup):
+        func()
+    tracemalloc.start()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return float(np.median(times)), float(np.min(times)), peak
+
+
+def bench_case(formula, width, height, repeat):
+    frame = synthetic_frame(width, height)
+    engine = DistortionEngine(formula)
+
+    def build_maps():
+        engine.cache.clear()
+        engine.maps(width, height)
+
+    # Для анимированных формул каждый вызов получает новое t (30 кадров в секунду)
+    frames = itertools.count()
+    next_t = lambda: next(frames) / 30
+
+    preview = engine.preview(frame, DISPLAY_SIZE)
+    cases = [
+        ("distort", lambda: engine.distort(frame, next_t()), repeat),
+        ("preview", lambda: engine.preview(frame, DISPLAY_SIZE, next_t()), repeat),
+        ("convert", lambda: bgr_to_pil(preview), repeat),
+    ]
+    if not engine.is_animated:  # У анимированных таблица строится на каждом кадре
+        cases.insert(0, ("build_maps", build_maps, max(3, repeat // 10)))
+    stages = {}
+    for name, func, n in cases:
+        median, best, peak = time_stage(func, n)
+        stages[name] = {"ms": round(median, 3), "min_ms": round(best, 3), "peak_bytes": peak}
+
+    # Кадр предпросмотра и кадр при записи (добавляется полноразмерный эффект)
+    frame_ms = stages["preview"]["ms"] + stages["convert"]["ms"]
+    record_ms = frame_ms + stages["distort"]["ms"]
+    return {
+        "formula": formula,
+        "width": width,
+        "height": height,
+        "stages": stages,
+        "frame_ms": round(frame_ms, 3),
+        "fps": round(1000 / frame_ms, 1) if frame_ms else None,
+        "record_frame_ms": round(record_ms, 3),
+        "record_fps": round(1000 / record_ms, 1) if record_ms else None,
+    }
+
+
+def scaling_curve(formula, width, height, max_workers, repeat):
+    """Время distort при делении кадра на 1..max_workers полос"""
+    frame = synthetic_frame(width, height)
+    out = np.empty_like(frame)
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(1)  # Иначе OpenCV сам распараллеливает remap и кривая ничего не показывает
+    try:
+        curve = []
+        for workers in range(1, max_workers + 1):
+            engine = DistortionEngine(formula, workers=workers)
+            median, best, _ = time_stage(lambda: engine.distort(frame, out=out), repeat)
+            engine.shutdown()
+            curve.append({"workers": workers, "ms": round(median, 3), "min_ms": round(best, 3)})
+    finally:
+        cv2.setNumThreads(threads)
+    for point in curve:
+        point["speedup"] = round(curve[0]["ms"] / point["ms"], 2) if point["ms"] else None
+    return curve
+
+
+def import_time(repeat=3):
+    """Медиана времени импорта ReDisCa в новом интерпретаторе, мс"""
+    code = ("import time; start = time.perf_counter(); import ReDisCa; "
+            "print((time.perf_counter() - start) * 1000)")
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        if out.returncode == 0:
+            times.append(float(out.stdout.strip().splitlines()[-1]))
+    return round(float(np.median(times)), 1) if times else None
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cv2_threads": cv2.getNumThreads(),
+    }
+
+
+def run(resolutions, formulas, repeat, scaling=0):
+    results = []
+    for res in resolutions:
+        width, height = RESOLUTIONS[res]
+        for formula in formulas:
+            case = bench_case(formula, width, height, repeat)
+            case["resolution"] = res
+            results.append(case)
+            print(f"{res:>6} {formula:<20} distort {case['stages']['distort']['ms']:7.2f} ms  "
+                  f"preview {case['stages']['preview']['ms']:7.2f} ms  {case['fps']:7.1f} FPS  "
+                  f"(record {case['record_fps']:6.1f} FPS)", file=sys.stderr)
+    report = {"environment": environment(), "repeat": repeat, "import_ms": import_time(), "results": results}
+    if scaling:
+        report["scaling"] = []
+        for res in resolutions:
+            width, height = RESOLUTIONS[res]
+            curve = scaling_curve(formulas[0], width, height, scaling, repeat)
+            report["scaling"].append({"resolution": res, "formula": formulas[0], "curve": curve})
+            print(f"{res:>6} scaling " + "  ".join(f"{p['workers']}: {p['ms']:.2f} ms (x{p['speedup']})"
+                                                 for p in curve), file=sys.stderr)
+    if resource is not None:
+        # ru_maxrss: КБ в Linux, байты в macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        report["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости эффекта и предпросмотра")
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument("--formulas", nargs="+", default=FORMULAS)
+    parser.add_argument("--repeat", type=int, default=30, help="повторов на этап")
+    parser.add_argument("--scaling", type=int, nargs="?", const=os.cpu_count() or 1, default=0,
+                        metavar="N", help="кривая масштабирования remap на 1..N потоках (по умолчанию N - все ядра)")
+    parser.add_argument("-o", "--output", help="файл JSON (по умолчанию - stdout)")
+    args = parser.parse_args(argv)
+
+    report = run(args.resolutions, args.formulas, args.repeat, args.scaling)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())